@@ -0,0 +1,439 @@
+"""
+Headless benchmark of the app on synthetic datasets.
+
+Generates `final_data5.csv`, `top_client_data.csv` and `financial_tool.csv`
+files matching the real schemas at each requested size, then drives every
+tab with Streamlit's AppTest in a fresh process per size and writes the
+cold-start time, per-interaction latency and peak memory to a JSON file:
+
+    python benchmark.py --rows 10000 100000 --output benchmark_results.json
+    python benchmark.py --rows 10000 --baseline benchmark_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib.metadata import version
+
+import numpy as np
+import pandas as pd
+
+# Sizes benchmarked by default, in rows of every dataset
+BENCHMARK_ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Directory of the generated datasets next to the app, one subdirectory
+# per size, kept between runs
+BENCHMARK_DATA_DIR = "benchmark_data"
+
+# Rows generated and written at a time, a multiple of the orders per client
+GENERATE_CHUNK_ROWS = 1_000_000
+
+# Orders of each client in the order history
+ORDERS_PER_CLIENT = 50
+
+# Value sets of the categorical columns
+BRANCHES = 60
+CONTACT_METHODS = ["Phone", "Visit", "Online", "Store"]
+CLIENT_TYPES = ["recurrent_client", "occasional_client", "new_client"]
+RELATION_QUALITIES = ["good", "average", "bad"]
+
+# Budgets entered in the Financial Tool
+BENCHMARK_BUDGETS = [1_000.0, 100_000.0, 10_000_000.0]
+
+# Seconds AppTest waits for one rerun
+BENCHMARK_TIMEOUT = 3600
+
+# Change in latency, as a ratio, reported when comparing with a baseline
+REGRESSION_THRESHOLD = 1.2
+
+APP_FILE = "handover.py"
+APP_ASSETS = [APP_FILE, "images"]
+
+def generate_clients(rng, start, stop):
+    """
+    Generate the clients of rows `start` to `stop`, with the columns of
+    `final_data5.csv`.
+    """
+    n = stop - start
+    return pd.DataFrame({
+        "client_id": np.arange(100_000 + start, 100_000 + stop),
+        "branch_id": rng.integers(1, BRANCHES + 1, n),
+        "priority_score": rng.random(n)*10,
+        "churn_probability": rng.random(n),
+        "tot_sales_net": rng.gamma(2, 5_000, n),
+        "avg_freq_orders": rng.random(n)*30,
+        "lag_day_last": rng.integers(0, 700, n).astype(float),
+        "pref_cont_method": rng.choice(CONTACT_METHODS, n),
+        "client_type": rng.choice(CLIENT_TYPES, n),
+        "nb_orders": rng.integers(1, 200, n),
+        "nb_ret": rng.integers(0, 10, n).astype(float),
+        "quali_relation": rng.choice(RELATION_QUALITIES, n),
+        "pct_online": rng.random(n),
+        "pct_store": rng.random(n),
+        "pct_phone": rng.random(n),
+        "pct_visits": rng.random(n),
+        "pct_other": rng.random(n),
+    }, index=pd.RangeIndex(start, stop))
+
+def generate_financials(rng, clients):
+    """
+    Generate the columns of `financial_tool.csv` for the given clients.
+    """
+    n = len(clients)
+    financials = clients[[
+        "client_id", "branch_id", "priority_score", "churn_probability", "tot_sales_net", "pref_cont_method",
+    ]].copy()
+    financials["tot_client_cost"] = rng.gamma(2, 100, n)
+    financials["return_client"] = financials["tot_sales_net"]*rng.uniform(0.1, 0.5, n)
+    financials["cost"] = rng.integers(10, 500, n).astype(float)
+    return financials
+
+def generate_orders(rng, start, stop):
+    """
+    Generate the orders of rows `start` to `stop`, with the columns of
+    `top_client_data.csv`, sorted by client and date.
+    """
+    n = stop - start
+    client_ids = 100_000 + np.arange(start, stop)//ORDERS_PER_CLIENT
+    days = rng.integers(0, 5*365, n)
+    order = np.lexsort((days, client_ids))
+    return pd.DataFrame({
+        "client_id": client_ids[order],
+        "date_order": (np.datetime64("2015-01-01") + days[order]).astype("datetime64[D]"),
+        "sales_net": rng.gamma(1.5, 800, n)[order],
+    }, index=pd.RangeIndex(start, stop))
+
+def generate_datasets(directory, rows, seed=0):
+    """
+    Write the three synthetic datasets of `rows` rows each into `directory`,
+    unless a previous run already did.
+    """
+    marker = os.path.join(directory, ".complete")
+    if os.path.exists(marker):
+        return False
+
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        name: open(os.path.join(directory, name), "w", newline="")
+        for name in ["final_data5.csv", "financial_tool.csv", "top_client_data.csv"]
+    }
+    try:
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            stop = min(start + GENERATE_CHUNK_ROWS, rows)
+            rng = np.random.default_rng([seed, start])
+            clients = generate_clients(rng, start, stop)
+            chunks = {
+                "final_data5.csv": clients,
+                "financial_tool.csv": generate_financials(rng, clients),
+                "top_client_data.csv": generate_orders(rng, start, stop),
+            }
+            for name, chunk in chunks.items():
+                chunk.to_csv(files[name], header=start == 0, float_format="%.6f")
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(marker, "w") as f:
+        f.write(str(rows))
+    return True
+
+def prepare_workdir(rows):
+    """
+    Generate the datasets of one size and link the app next to them, so it
+    reads them from its working directory. Returns the directory and the
+    seconds spent generating.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    directory = os.path.join(app_dir, BENCHMARK_DATA_DIR, str(rows))
+    start = time.perf_counter()
+    generated = generate_datasets(directory, rows)
+    elapsed = time.perf_counter() - start if generated else None
+
+    for asset in APP_ASSETS:
+        link = os.path.join(directory, asset)
+        if not os.path.lexists(link):
+            os.symlink(os.path.join(app_dir, asset), link)
+    return directory, elapsed
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process so far, in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024
+
+def find_widget(widgets, label):
+    """
+    Return the widget with the given label.
+    """
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No widget labelled {label!r}")
+
+class Session:
+    """
+    Drive one AppTest session and record the latency, stage timings and
+    peak memory of every interaction.
+    """
+
+    def __init__(self, app_path):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(app_path, default_timeout=BENCHMARK_TIMEOUT)
+        self.interactions = []
+
+    def run(self, tab, action, change=None):
+        """
+        Apply `change` to the app, rerun it and record the interaction.
+        Returns the rerun's seconds.
+        """
+        if change is not None:
+            change(self.app)
+        self.app.session_state["last_rerun"] = None
+        start = time.perf_counter()
+        self.app.run()
+        elapsed = time.perf_counter() - start
+
+        last_rerun = self.app.session_state["last_rerun"] if "last_rerun" in self.app.session_state else None
+        self.interactions.append({
+            "tab": tab,
+            "action": action,
+            "ms": elapsed*1000,
+            "peak_memory_mb": peak_memory_mb(),
+            "stages": [
+                {"name": span["name"], "depth": span["depth"], "ms": span["ms"], "rows": span["rows"]}
+                for span in last_rerun["spans"]
+            ] if last_rerun else [],
+            "exceptions": [str(e.value) for e in self.app.exception],
+            "errors": [e.value for e in self.app.error],
+        })
+        return elapsed
+
+    def select(self, kind, label, value):
+        """
+        Return a change setting the widget of the given kind and label.
+        """
+        return lambda app: find_widget(getattr(app, kind), label).set_value(value)
+
+    def open_tab(self, tab):
+        return self.run(tab, "open tab", self.select("radio", "Navigation", tab))
+
+def bench_home(session):
+    tab = "Home Page"
+    session.open_tab(tab)
+    branch = find_widget(session.app.selectbox, "Select Branch").options[1]
+    session.run(tab, f"branch {branch}", session.select("selectbox", "Select Branch", branch))
+    session.run(tab, "branch All", session.select("selectbox", "Select Branch", "All"))
+
+def bench_ranking(session):
+    tab = "AI Client Ranking"
+    session.open_tab(tab)
+    client_types = find_widget(session.app.multiselect, "Filter by Client Type").options
+    branch = find_widget(session.app.selectbox, "Select Branch").options[1]
+    for branch_filter in ["All", branch]:
+        session.run(tab, f"branch {branch_filter}", session.select("selectbox", "Select Branch", branch_filter))
+        for types in [client_types, client_types[1:], client_types[:1]]:
+            session.run(
+                tab, f"types {', '.join(types)}",
+                session.select("multiselect", "Filter by Client Type", types)
+            )
+            for sort_by in ["Priority Score", "Probability of Churn", "Total Net Sales", ""]:
+                session.run(tab, f"sort by {sort_by or 'none'}", session.select("selectbox", "Sort by", sort_by))
+
+    session.run(tab, "rows per page 250", session.select("selectbox", "Rows per page", 250))
+    last_page = find_widget(session.app.number_input, "Page").max
+    session.run(tab, "last page", session.select("number_input", "Page", last_page))
+    session.run(tab, "custom weights", session.select("checkbox", "Use custom weights", True))
+    session.run(tab, "change weight", session.select("slider", "Churn probability", 0.8))
+    session.run(tab, "default weights", session.select("checkbox", "Use custom weights", False))
+
+def bench_deep_dive(session, rows):
+    tab = "Client Deep-dive"
+    session.open_tab(tab)
+    # The first clients are the ones with an order history
+    client_ids = [100_000 + i for i in range(3)]
+    for client_id in client_ids:
+        session.run(tab, "client lookup", session.select("text_input", "Enter Client ID:", str(client_id)))
+    session.run(tab, "missing client lookup", session.select("text_input", "Enter Client ID:", str(100_000 + rows)))
+
+    session.run(tab, "client lookup", session.select("text_input", "Enter Client ID:", str(client_ids[0])))
+    low, high = find_widget(session.app.slider, "Visible range:").value
+    session.run(tab, "zoom chart", session.select("slider", "Visible range:", (low + (high - low)/4, high - (high - low)/4)))
+
+    session.run(tab, "compare top clients", session.select("radio", "Clients to compare", "Top clients by Priority Score"))
+    session.run(tab, "compare 50 top clients", session.select("number_input", "Number of clients:", 50))
+    compared = ", ".join(str(100_000 + i) for i in range(min(10, rows//ORDERS_PER_CLIENT)))
+    session.run(tab, "compare by client IDs", session.select("radio", "Clients to compare", "Client IDs"))
+    session.run(tab, "compare client IDs", session.select("text_area", "Enter Client IDs (separated by commas or new lines):", compared))
+    session.run(tab, "small multiples", session.select("radio", "Chart layout", "Small multiples"))
+
+def bench_financial(session):
+    tab = "Financial Tool"
+    session.open_tab(tab)
+    for sorting_criterion in ["Priority Score", "Total Client Return"]:
+        session.run(tab, f"sort by {sorting_criterion}", session.select("selectbox", "Sort by", sorting_criterion))
+        for budget in BENCHMARK_BUDGETS:
+            session.run(tab, f"budget {budget:,.0f}", session.select("number_input", "Available Budget:", budget))
+
+    session.run(tab, "budget sweep", session.select("radio", "Mode", "Budget sweep"))
+    for sorting_criterion in ["Priority Score", "Total Client Return"]:
+        session.run(tab, f"sweep sorted by {sorting_criterion}", session.select("selectbox", "Sort by", sorting_criterion))
+        max_budget = find_widget(session.app.slider, "Read budget off the curve:").max
+        session.run(tab, "read budget off the curve", session.select("slider", "Read budget off the curve:", max_budget/4))
+
+    session.run(tab, "optimize return", session.select("radio", "Mode", "Optimize return"))
+    for budget in BENCHMARK_BUDGETS:
+        session.run(tab, f"optimize budget {budget:,.0f}", session.select("number_input", "Available Budget:", budget))
+
+def run_benchmark(directory, rows, startup_only):
+    """
+    Benchmark the app in `directory` from this fresh process. The first
+    rerun is the cold start.
+    """
+    os.chdir(directory)
+    session = Session(os.path.join(directory, APP_FILE))
+    result = {"startup_s": session.run("Home Page", "start")}
+    if not startup_only:
+        bench_home(session)
+        bench_ranking(session)
+        bench_deep_dive(session, rows)
+        bench_financial(session)
+    result["peak_memory_mb"] = peak_memory_mb()
+    result["interactions"] = session.interactions
+    return result
+
+def run_child(directory, rows, startup_only=False):
+    """
+    Run the benchmark of one size in a fresh Python process, with stage
+    timings recorded, and return its result.
+    """
+    env = dict(os.environ, HANDOVER_TIMINGS="1", HANDOVER_DATA_STORE=os.path.join(directory, ".data_store"))
+    with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+        command = [sys.executable, os.path.abspath(__file__), "--child", directory, "--rows", str(rows), "--output", output.name]
+        if startup_only:
+            command.append("--startup-only")
+        process = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Benchmark at {rows:,} rows failed:\n{process.stderr[-4000:]}")
+        return json.load(output)
+
+def benchmark_size(rows):
+    """
+    Benchmark the app at one size: a cold start that builds the data store
+    and drives every tab, then a restart reusing the data store.
+    """
+    directory, generate_s = prepare_workdir(rows)
+    shutil.rmtree(os.path.join(directory, ".data_store"), ignore_errors=True)
+    cold = run_child(directory, rows)
+    restart = run_child(directory, rows, startup_only=True)
+    return {
+        "rows": rows,
+        "generate_s": generate_s,
+        "cold_start_s": cold["startup_s"],
+        "restart_s": restart["startup_s"],
+        "peak_memory_mb": cold["peak_memory_mb"],
+        "interactions": cold["interactions"],
+    }
+
+def app_revision():
+    """
+    Git revision of the app, marked dirty if it has uncommitted changes.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=app_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision
+
+def environment():
+    """
+    Describe the machine and package versions the benchmark ran with.
+    """
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": {name: version(name) for name in ["streamlit", "pandas", "numpy", "pyarrow", "plotly"]},
+    }
+
+def compare_results(results, baseline):
+    """
+    Print the cold starts and interactions that got slower or faster than
+    in the baseline by more than the regression threshold.
+    """
+    previous = {run["rows"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        before = previous.get(run["rows"])
+        if before is None:
+            continue
+        pairs = [("cold start", before["cold_start_s"]*1000, run["cold_start_s"]*1000)]
+        pairs += [
+            (f"{new['tab']}: {new['action']}", old["ms"], new["ms"])
+            for old, new in zip(before["interactions"], run["interactions"])
+            if (old["tab"], old["action"]) == (new["tab"], new["action"])
+        ]
+        for name, old_ms, new_ms in pairs:
+            ratio = new_ms/max(old_ms, 1e-3)
+            if ratio > REGRESSION_THRESHOLD or ratio < 1/REGRESSION_THRESHOLD:
+                print(f"{run['rows']:>12,} rows  {name:<55} {old_ms:10.1f} ms -> {new_ms:10.1f} ms ({ratio:.2f}x)")
+
+def summarize(run):
+    """
+    Print the headline figures of one size.
+    """
+    latencies = np.array([interaction["ms"] for interaction in run["interactions"]])
+    exceptions = sum(len(interaction["exceptions"]) for interaction in run["interactions"])
+    print(
+        f"{run['rows']:>12,} rows  cold start {run['cold_start_s']:.2f} s, restart {run['restart_s']:.2f} s, "
+        f"median {np.median(latencies):.0f} ms, p95 {np.percentile(latencies, 95):.0f} ms, "
+        f"max {latencies.max():.0f} ms, peak {run['peak_memory_mb']:.0f} MiB, {exceptions} exceptions"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=BENCHMARK_ROWS, help="rows of every dataset, per run")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--startup-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_benchmark(args.child, args.rows[0], args.startup_only)
+        with open(args.output, "w") as f:
+            json.dump(result, f, default=str)
+        return
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": app_revision(),
+        "environment": environment(),
+        "runs": [],
+    }
+    for rows in args.rows:
+        run = benchmark_size(rows)
+        summarize(run)
+        results["runs"].append(run)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Changes against {baseline['revision']} ({baseline['created']}):")
+        compare_results(results, baseline)
+
+if __name__ == "__main__":
+    main()
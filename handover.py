@@ -1,19 +1,1665 @@
+import cProfile
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+from openpyxl import Workbook
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# Timing spans of the rerun running on the current thread, if it records them
+profiling = threading.local()
+
+# Cached frames are handed out as shallow copies, so copy-on-write (always on
+# from pandas 3) keeps callers' filters and column assignments off the cache
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# Upper bound on the memory held by parsed datasets before the least recently
+# used ones are evicted
+DATA_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Rows parsed at a time when reading a dataset
+READ_CHUNK_ROWS = 500_000
+
+# Directory of the memory-mapped columnar copies of the datasets, shared by
+# every session and process on the host, and versions kept of each
+DATA_STORE_DIR = os.environ.get("HANDOVER_DATA_STORE", ".data_store")
+DATA_STORE_VERSIONS = 2
+
+# Storage type of each dataset column: "category" for low-cardinality labels,
+# "integer" and "float" for IDs and metrics downcast to the smallest fitting
+# type, "money" for amounts kept in float64 so totals stay exact to the cent,
+# and "datetime" for dates parsed once at load
+DATASET_SCHEMAS = {
+    "final_data5.csv": {
+        "client_id": "integer",
+        "branch_id": "category",
+        "priority_score": "float",
+        "churn_probability": "float",
+        "tot_sales_net": "money",
+        "avg_freq_orders": "float",
+        "lag_day_last": "float",
+        "pref_cont_method": "category",
+        "client_type": "category",
+        "nb_orders": "integer",
+        "nb_ret": "float",
+        "quali_relation": "category",
+        "pct_online": "float",
+        "pct_store": "float",
+        "pct_phone": "float",
+        "pct_visits": "float",
+        "pct_other": "float",
+    },
+    "top_client_data.csv": {
+        "client_id": "integer",
+        "date_order": "datetime",
+        "sales_net": "money",
+    },
+    "financial_tool.csv": {
+        "client_id": "integer",
+        "branch_id": "category",
+        "priority_score": "float",
+        "churn_probability": "float",
+        "tot_sales_net": "money",
+        "tot_client_cost": "money",
+        "return_client": "money",
+        "pref_cont_method": "category",
+        "cost": "money",
+    },
+}
+
+# Column the stored copy of a dataset is sorted by, so the order history of
+# each client is one contiguous slice of the mapped file
+DATASET_SORT_KEYS = {
+    "top_client_data.csv": "client_id",
+}
+
+# Columns of the AI Client Ranking table and their display names
+RANKING_COLUMNS = {
+    'client_id': 'Client ID',
+    'branch_id': 'Branch ID',
+    'priority_score':'Priority Score',
+    'churn_probability': 'Probability of Churn',
+    'tot_sales_net': 'Total Net Sales',
+    'avg_freq_orders': 'Frequency Orders',
+    'lag_day_last': 'Days since Last Order',
+    'pref_cont_method': 'Preferred Way of Contact',
+    'client_type' : 'client_type'
+}
+
+# Metrics the AI Client Ranking table can be sorted by, highest first
+RANKING_SORTS = ["Priority Score", "Probability of Churn", "Total Net Sales"]
+
+# Rows per page offered by the paginated tables
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Download formats of the exported tables: file extension and MIME type
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Rows converted at a time when exporting, and data rows per Excel sheet
+EXPORT_CHUNK_ROWS = 100_000
+EXCEL_MAX_ROWS = 1_048_575
+
+# Columns of the Financial Tool table and their display names
+FINANCIAL_COLUMNS = {
+    'client_id': 'Client ID',
+    'branch_id': 'Branch ID',
+    'priority_score':'Priority Score',
+    'churn_probability': 'Probability of Churn',
+    'tot_sales_net': 'Total Net Sales',
+    'tot_client_cost': 'Total Client Cost',
+    'return_client':'Total Client Return',
+    'pref_cont_method':'Contact',
+    'cost':'Cost'
+}
+
+# Criteria the Financial Tool can select clients by, highest first
+FINANCIAL_SORTS = ["Priority Score", "Total Client Return"]
+
+# Most budget breakpoints plotted on the Financial Tool's budget sweep curve
+SWEEP_POINTS = 1_000
+
+# Largest dynamic programming table, in cells, the exact knapsack solver fills
+KNAPSACK_EXACT_CELLS = 20_000_000
+
+# Capacity steps and number of clients around the greedy cutoff used by the
+# approximate knapsack solver when the exact one would be too large
+KNAPSACK_SCALE_STEPS = 2_000
+KNAPSACK_CORE_SIZE = 4_000
+
+# Wall-clock cap, in seconds, of the knapsack solver
+KNAPSACK_TIME_LIMIT = 1.0
+
+# Resolutions of the Deep-dive sales chart with their period and length in
+# days, finest first
+TIME_SERIES_RESOLUTIONS = {
+    "Daily": ("D", 1),
+    "Weekly": ("W", 7),
+    "Monthly": ("M", 30),
+}
+
+# Most buckets aggregated for the sales chart, and most points sent to the
+# browser once those are downsampled
+TIME_SERIES_MAX_BUCKETS = 5_000
+TIME_SERIES_POINTS = 1_000
+
+# Most clients the Deep-dive compares at once
+MAX_COMPARED_CLIENTS = 50
+
+# Columns of the Deep-dive comparison table and their display names
+COMPARE_COLUMNS = {
+    'client_id': 'Client ID',
+    'branch_id': 'Branch ID',
+    'priority_score': 'Priority Score',
+    'churn_probability': 'Probability of Churn',
+    'tot_sales_net': 'Total Net Sales',
+    'avg_freq_orders': 'Frequency Orders',
+    'lag_day_last': 'Days since Last Order',
+    'client_type': 'Client Type',
+}
+
+# Features of the in-app priority score: label, direction (1 if a higher
+# value means a higher priority) and default weight
+SCORING_FEATURES = {
+    'churn_probability': ('Churn probability', 1, 0.4),
+    'tot_sales_net': ('Total net sales', 1, 0.3),
+    'avg_freq_orders': ('Order frequency', 1, 0.1),
+    'lag_day_last': ('Days since last order', 1, 0.1),
+    'nb_orders': ('Number of orders', 1, 0.1),
+}
+
+# Dataset and columns the priority score is computed from
+SCORING_DATASET = ("final_data5.csv", ["client_id"] + list(SCORING_FEATURES))
+
+# Weight vectors whose scores are kept in memory
+SCORE_MEMO_SIZE = 32
+
+# Order history the Home Page summarizes by month
+ORDER_HISTORY_FILE = "top_client_data.csv"
+
+# Seconds between two checks of the data files for a new version
+DATA_REFRESH_SECONDS = 60
+
+# Record the stage timings of every rerun and log them as JSON, even with
+# the debug panel hidden
+PROFILE_ALL_RERUNS = os.environ.get("HANDOVER_TIMINGS") == "1"
+
+# Datasets read by each tab, with the columns it needs from them. A tab only
+# loads its own entries, when it is shown.
+TAB_DATASETS = {
+    "Home Page": {
+        "data": ("final_data5.csv", ["client_id", "branch_id", "client_type", "nb_orders", "tot_sales_net"]),
+    },
+    "AI Client Ranking": {
+        "data": ("final_data5.csv", [
+            "client_id", "branch_id", "priority_score", "churn_probability", "tot_sales_net",
+            "avg_freq_orders", "lag_day_last", "pref_cont_method", "client_type",
+        ]),
+    },
+    "Client Deep-dive": {
+        "data": ("final_data5.csv", [
+            "client_id", "branch_id", "priority_score", "churn_probability", "tot_sales_net",
+            "avg_freq_orders", "lag_day_last", "nb_ret", "quali_relation", "client_type",
+            "pct_online", "pct_store", "pct_phone", "pct_visits", "pct_other",
+        ]),
+        "time_data": ("top_client_data.csv", ["client_id", "date_order", "sales_net"]),
+    },
+    "Financial Tool": {
+        "financial_data": ("financial_tool.csv", [
+            "client_id", "branch_id", "priority_score", "churn_probability", "tot_sales_net",
+            "tot_client_cost", "return_client", "pref_cont_method", "cost",
+        ]),
+    },
+}
+
+# Every data file, watched by the background refresher
+DATA_FILES = sorted({
+    file_path for datasets in TAB_DATASETS.values() for file_path, _ in datasets.values()
+})
+
+class TimingSpan:
+    """
+    Time a named stage of a rerun, and the number of rows it handled, when
+    the rerun records timings. Otherwise entering and leaving it does nothing.
+    """
+    __slots__ = ("spans", "record", "rows", "start")
+
+    def __init__(self, spans, name, rows):
+        self.spans = spans
+        self.record = {"name": name, "ms": None, "rows": rows, "depth": 0} if spans is not None else None
+        self.rows = rows
+
+    def __enter__(self):
+        if self.spans is not None:
+            self.record["depth"] = profiling.depth
+            profiling.depth += 1
+            self.spans.append(self.record)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.spans is not None:
+            self.record["ms"] = (time.perf_counter() - self.start)*1000
+            self.record["rows"] = self.rows
+            profiling.depth -= 1
+        return False
+
+def timing_span(name, rows=None):
+    """
+    Return a span timing the named stage of the current rerun. Set its
+    `rows` attribute to report how many rows the stage handled.
+    """
+    return TimingSpan(getattr(profiling, "spans", None), name, rows)
+
+def show_debug_panel():
+    """
+    Show the debug panel in the sidebar when the app is opened with
+    `?debug=1`: the stage timings of the last rerun and the profiler toggles.
+    Returns which of timings, cProfile and pyinstrument to capture.
+    """
+    settings = {"timings": PROFILE_ALL_RERUNS, "cprofile": False, "pyinstrument": False}
+    if st.query_params.get("debug") != "1":
+        return settings
+
+    with st.sidebar.expander("Debug", expanded=True):
+        settings["timings"] = st.checkbox("Record stage timings", value=True, key="debug_timings") or PROFILE_ALL_RERUNS
+        settings["cprofile"] = st.checkbox("Capture cProfile", key="debug_cprofile")
+        if Profiler is not None:
+            settings["pyinstrument"] = st.checkbox("Capture pyinstrument", key="debug_pyinstrument")
+
+        last_rerun = st.session_state.get("last_rerun")
+        if last_rerun is not None:
+            st.caption(f"Last rerun: {last_rerun['tab']}, {last_rerun['total_ms']:.1f} ms")
+            st.dataframe(pd.DataFrame([
+                {
+                    "Stage": "\u2003"*span["depth"] + span["name"],
+                    "ms": round(span["ms"], 2) if span["ms"] is not None else None,
+                    "Rows": span["rows"],
+                }
+                for span in last_rerun["spans"]
+            ]), hide_index=True)
+        if st.session_state.get("last_profile"):
+            st.code(st.session_state["last_profile"], language=None)
+    return settings
+
+@st.cache_resource
+def get_timings_logger():
+    """
+    Logger of the rerun timings, writing one JSON line per recorded rerun to
+    the standard error, whatever the logging configuration.
+    """
+    timings_logger = logging.getLogger("handover.timings")
+    timings_logger.setLevel(logging.INFO)
+    timings_logger.propagate = False
+    if not timings_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        timings_logger.addHandler(handler)
+    return timings_logger
+
+def start_profiling(settings):
+    """
+    Start recording the current rerun as the debug settings ask.
+    """
+    profiling.spans = [] if settings["timings"] else None
+    profiling.depth = 0
+    profiling.start = time.perf_counter()
+    profiling.profiler = None
+    if settings["pyinstrument"]:
+        profiling.profiler = Profiler()
+        profiling.profiler.start()
+    elif settings["cprofile"]:
+        profiling.profiler = cProfile.Profile()
+        profiling.profiler.enable()
+
+def finish_profiling(tab):
+    """
+    Stop recording the current rerun, keep its breakdown for the debug panel
+    and log it as one JSON line.
+    """
+    profiler = profiling.profiler
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(30)
+        st.session_state["last_profile"] = report.getvalue()
+    elif profiler is not None:
+        profiler.stop()
+        st.session_state["last_profile"] = profiler.output_text()
+    else:
+        st.session_state.pop("last_profile", None)
+
+    spans = profiling.spans
+    profiling.spans = profiling.profiler = None
+    if spans is None:
+        return
+    rerun = {
+        "event": "rerun",
+        "tab": tab,
+        "total_ms": (time.perf_counter() - profiling.start)*1000,
+        "spans": spans,
+    }
+    st.session_state["last_rerun"] = rerun
+    get_timings_logger().info(json.dumps(rerun, default=str))
+
+@st.cache_resource
+def get_data_cache():
+    """
+    Process-wide cache of parsed datasets, shared by every session.
+    """
+    return {
+        "lock": threading.Lock(),
+        "file_locks": {},
+        "digests": {},
+        "entries": OrderedDict(),
+        "nbytes": 0,
+    }
+
+def file_digest(file_path):
+    """
+    Hash the contents of a file, reading it in blocks.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def dataset_version(file_path):
+    """
+    Return the content hash of a data file, re-hashing it only when its size or
+    modification time changed since the last call.
+    """
+    cache = get_data_cache()
+    stat = os.stat(file_path)
+    fingerprint = (stat.st_size, stat.st_mtime_ns)
+    with cache["lock"]:
+        known = cache["digests"].get(file_path)
+    if known is not None and known[0] == fingerprint:
+        return known[1]
+    digest = file_digest(file_path)
+    with cache["lock"]:
+        cache["digests"][file_path] = (fingerprint, digest)
+    return digest
+
+def apply_schema(frame, schema):
+    """
+    Convert the columns of a parsed frame to the compact types of its schema.
+    """
+    for column, kind in schema.items():
+        if column not in frame.columns:
+            continue
+        values = frame[column]
+        if kind == "category":
+            frame[column] = values.astype("category")
+        elif kind == "datetime":
+            frame[column] = pd.to_datetime(values)
+        elif kind == "integer" and values.dtype.kind in "iu":
+            frame[column] = pd.to_numeric(values, downcast="integer")
+        elif kind == "float" and values.dtype.kind == "f":
+            frame[column] = values.astype("float32")
+    return frame
+
+def concat_chunks(chunks):
+    """
+    Concatenate parsed chunks, unifying their categories first so categorical
+    columns stay categorical.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    for column in chunks[0].columns:
+        if not isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            continue
+        categories = chunks[0][column].cat.categories
+        for chunk in chunks[1:]:
+            categories = categories.union(chunk[column].cat.categories)
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+class DigestReader(io.RawIOBase):
+    """
+    Read a binary file while hashing every byte read from it, so a parse can
+    tell which version of the file it actually read.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.f.readinto(buffer)
+        self.digest.update(memoryview(buffer)[:size])
+        return size
+
+    def hexdigest(self):
+        """
+        Hash the rest of the file, then return the digest of all of it.
+        """
+        for block in iter(lambda: self.f.read(1 << 20), b""):
+            self.digest.update(block)
+        return self.digest.hexdigest()
+
+def parse_csv(file_path, usecols=None, version=None):
+    """
+    Parse the dataset from the given CSV file, keeping only `usecols` if given.
 
-def load_data(file_path):
+    The file is read in chunks that are converted to the dataset's schema as
+    they arrive, so the wide default dtypes never exist for the whole file.
+    With a `version`, the bytes parsed are hashed as they are read, and a
+    ValueError is raised if the file no longer is that version.
+    """
+    schema = DATASET_SCHEMAS.get(os.path.basename(file_path), {})
+    with open(file_path, "rb", buffering=0) as f:
+        reader = DigestReader(f)
+        chunks = [
+            apply_schema(chunk, schema)
+            for chunk in pd.read_csv(io.BufferedReader(reader), usecols=usecols, chunksize=READ_CHUNK_ROWS)
+        ]
+        if version is not None and reader.hexdigest() != version:
+            raise ValueError(f"{file_path} changed, version {version} is no longer available")
+    return sort_dataset(file_path, concat_chunks(chunks))
+
+def sort_dataset(file_path, frame):
+    """
+    Sort a parsed dataset by its column in DATASET_SORT_KEYS, if it has one,
+    keeping the file order within equal keys.
+    """
+    column = DATASET_SORT_KEYS.get(os.path.basename(file_path))
+    if column is None or column not in frame.columns or frame[column].is_monotonic_increasing:
+        return frame
+    return frame.sort_values(column, kind="stable", ignore_index=True)
+
+def store_path(file_path, version):
+    """
+    Return the path of the columnar copy of a version of a dataset.
+    """
+    return os.path.join(DATA_STORE_DIR, f"{os.path.basename(file_path)}.{version}.arrow")
+
+def write_to_store(file_path, version, frame):
+    """
+    Write a parsed version of a dataset to the store as an Arrow IPC file.
+
+    The file is written under a temporary name and renamed into place, so
+    other sessions and processes only ever see complete versions. The least
+    recently used versions beyond DATA_STORE_VERSIONS are then removed, except
+    the one of the published snapshot; processes still mapping them keep
+    their pages until they let go.
+    """
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    os.makedirs(DATA_STORE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=DATA_STORE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, store_path(file_path, version))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    snapshot = get_snapshot_store()["snapshot"]
+    keep = {store_path(file_path, version)}
+    if snapshot is not None and file_path in snapshot["versions"]:
+        keep.add(store_path(file_path, snapshot["versions"][file_path]))
+    prefix = f"{os.path.basename(file_path)}."
+    versions = sorted(
+        (os.path.join(DATA_STORE_DIR, name) for name in os.listdir(DATA_STORE_DIR)
+         if name.startswith(prefix) and name.endswith(".arrow")),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for old_path in versions[DATA_STORE_VERSIONS:]:
+        if old_path in keep:
+            continue
+        try:
+            os.unlink(old_path)
+        except OSError:
+            pass
+
+def read_data(file_path, usecols=None, version=None):
+    """
+    Read the dataset from the given file path, keeping only `usecols` if given.
+
+    The file is converted once per version to an Arrow file in the data store
+    and memory-mapped read-only from there. The returned columns are views of
+    the mapped pages, so every session and process on the host shares one
+    page-cache copy. A version missing from the store is parsed from the CSV,
+    which must still be that version. Without a writable store, the CSV is
+    parsed in-process.
+    """
+    if version is None:
+        version = dataset_version(file_path)
+    path = store_path(file_path, version)
+    try:
+        if not os.path.exists(path):
+            write_to_store(file_path, version, parse_csv(file_path, version=version))
+        # Mark the version as recently used, so other processes keep it
+        os.utime(path)
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    except OSError:
+        return parse_csv(file_path, usecols, version)
+
+    if usecols is not None:
+        table = table.select([column for column in table.column_names if column in usecols])
+    return table.to_pandas(split_blocks=True)
+
+def find_cached_frame(entries, file_path, version, usecols):
+    """
+    Return the key of a cached frame of this file version holding every column
+    in `usecols`, or None.
+    """
+    for key, (frame, _) in entries.items():
+        if key[0] != file_path or key[2] != version:
+            continue
+        if key[1] == usecols or (usecols is not None and set(usecols) <= set(frame.columns)):
+            return key
+    return None
+
+def load_data(file_path, usecols=None, version=None):
     """
     Load the dataset from the given file path.
+
+    Each file version is parsed once per process and reused. Without an
+    explicit `version`, the one of the published data snapshot is loaded.
+    With `usecols`, only those columns are parsed, unless an already cached
+    frame of the file contains them. Callers get a shallow copy of the cached
+    frame, so filtering it or assigning columns never alters the cache.
+    """
+    cache = get_data_cache()
+    if version is None:
+        snapshot = get_snapshot_store()["snapshot"]
+        version = snapshot["versions"].get(file_path) if snapshot else None
+    if version is None:
+        version = dataset_version(file_path)
+    usecols = tuple(usecols) if usecols is not None else None
+
+    with cache["lock"]:
+        file_lock = cache["file_locks"].setdefault(file_path, threading.Lock())
+
+    # Only one session parses a given file, the others wait for its result
+    with file_lock:
+        with cache["lock"]:
+            key = find_cached_frame(cache["entries"], file_path, version, usecols)
+            if key is not None:
+                cache["entries"].move_to_end(key)
+                entry = cache["entries"][key]
+        if key is None:
+            key = (file_path, usecols, version)
+            frame = read_data(file_path, usecols, version)
+            entry = (frame, int(frame.memory_usage(deep=True).sum()))
+            with cache["lock"]:
+                cache["entries"][key] = entry
+                cache["nbytes"] += entry[1]
+                while cache["nbytes"] > DATA_CACHE_MAX_BYTES and len(cache["entries"]) > 1:
+                    cache["nbytes"] -= cache["entries"].popitem(last=False)[1][1]
+
+    frame = entry[0]
+    if usecols is not None and key[1] != usecols:
+        frame = frame[list(usecols)]
+    else:
+        frame = frame.copy(deep=False)
+    frame.attrs["version"] = (file_path, version)
+    return frame
+
+def drop_stale_frames(versions):
     """
-    return pd.read_csv(file_path)
+    Evict the cached frames of file versions other than the given ones.
+    """
+    cache = get_data_cache()
+    with cache["lock"]:
+        for key in [k for k in cache["entries"] if versions.get(k[0], k[2]) != k[2]]:
+            cache["nbytes"] -= cache["entries"].pop(key)[1]
 
-def main():
-    # Load the dataset
-    data = load_data("final_data5.csv")
-    time_data = load_data("top_client_data.csv")
-    financial_data = load_data("financial_tool.csv")
+def frame_key(frame):
+    """
+    Identify a loaded frame by its file version and columns, to key the caches
+    of structures derived from it.
+    """
+    return frame.attrs["version"], tuple(frame.columns)
+
+@st.cache_resource(max_entries=2)
+def build_client_index(key, _data):
+    """
+    Build a hash index from client_id to the row position of the client in
+    `_data`, keeping the first row of duplicated IDs.
+    """
+    client_ids = _data["client_id"]
+    first = ~client_ids.duplicated().to_numpy()
+    return {
+        "clients": pd.Index(client_ids.to_numpy()[first]),
+        "positions": np.flatnonzero(first),
+    }
+
+@st.cache_resource(max_entries=2)
+def build_order_index(key, _time_data):
+    """
+    Record the offset where the rows of each client start in the order
+    history, so a client's orders are one contiguous slice. The history is
+    read sorted by client_id, so the slices are views of the shared data.
+    """
+    orders = sort_dataset(ORDER_HISTORY_FILE, _time_data)
+    client_ids, starts = np.unique(orders["client_id"].to_numpy(), return_index=True)
+    return {
+        "orders": orders,
+        "clients": pd.Index(client_ids),
+        "offsets": np.append(starts, len(orders)),
+    }
+
+def lookup_client(client_index, data, client_id):
+    """
+    Return the row of the given client in `data`, or None if it is unknown.
+    """
+    position = client_index["clients"].get_indexer([client_id])[0]
+    if position < 0:
+        return None
+    return data.iloc[client_index["positions"][position]]
+
+def lookup_orders(order_index, client_id):
+    """
+    Return the order history rows of the given client.
+    """
+    orders = order_index["orders"]
+    position = order_index["clients"].get_indexer([client_id])[0]
+    if position < 0:
+        return orders.iloc[:0]
+    offsets = order_index["offsets"]
+    return orders.iloc[offsets[position]:offsets[position + 1]]
+
+def build_budget_curve(costs, returns):
+    """
+    Precompute the greedy selection for every budget at once: the cumulative
+    cost and return of selecting the first k clients of the given order.
+    """
+    cumulative_cost = np.cumsum(costs)
+    return {
+        "cumulative_cost": cumulative_cost,
+        # The running maximum is sorted even with negative costs, and first
+        # exceeds a budget exactly where the cumulative cost does
+        "reachable_cost": np.maximum.accumulate(cumulative_cost),
+        "cumulative_return": np.cumsum(returns),
+    }
+
+def read_budget_curve(curve, budgets):
+    """
+    Return how many clients the greedy selection takes for each budget, with
+    their total cost and return. Works on a single budget or an array of them.
+    """
+    counts = np.searchsorted(curve["reachable_cost"], budgets, side="right")
+    # Prepend a zero so that selecting no client reads a zero total
+    costs = np.concatenate(([0.0], curve["cumulative_cost"]))[counts]
+    returns = np.concatenate(([0.0], curve["cumulative_return"]))[counts]
+    if np.ndim(budgets) == 0:
+        return int(counts), float(costs), float(returns)
+    return counts, costs, returns
+
+@st.cache_resource(max_entries=2)
+def build_financial_table(key, _financial_data):
+    """
+    Rename the Financial Tool columns for display and keep the clients reached
+    by phone or visit.
+    """
+    financial_data = _financial_data.rename(columns=FINANCIAL_COLUMNS)[list(FINANCIAL_COLUMNS.values())]
+    return financial_data[financial_data['Contact'].isin(['Phone', 'Visit'])]
+
+@st.cache_resource(max_entries=4)
+def get_budget_curve(key, sorting_criterion, _financial_data):
+    """
+    Sort the Financial Tool clients by the given criterion, best first, and
+    build their budget curve, with the sweep plotted from it.
+    """
+    order = np.argsort(-_financial_data[sorting_criterion].to_numpy(dtype="float64"), kind="stable")
+    curve = build_budget_curve(
+        _financial_data['Cost'].to_numpy()[order],
+        _financial_data['Total Client Return'].to_numpy()[order]
+    )
+    curve["order"] = order
+    curve["sweep"] = sweep_budget_curve(curve, SWEEP_POINTS)
+    return curve
+
+def sweep_budget_curve(curve, points):
+    """
+    Evaluate a budget curve at its breakpoints, the budgets at which the next
+    clients fit, with the expected clients back and 1-year return. Beyond
+    `points` breakpoints, the ones that best keep the curve's shape are kept.
+    """
+    # Every budget up to zero selects the same clients
+    budgets = np.unique(np.concatenate(([0.0], np.maximum(curve["reachable_cost"], 0.0))))
+    counts, _, returns = read_budget_curve(curve, budgets)
+    kept = downsample_lttb(budgets, returns, points)
+    counts, returns = counts[kept], returns[kept]
+    return pd.DataFrame({
+        'Budget': budgets[kept],
+        'Clients': counts,
+        'Expected clients back': np.round(counts*0.85),
+        'Expected total return (1y)': (returns/2)*0.85,
+    })
+
+def solve_knapsack_dp(weights, values, capacity, deadline):
+    """
+    Solve a 0/1 knapsack with integer weights by dynamic programming over the
+    capacity, one vectorized update per item.
+
+    Returns the indices of the chosen items, or None if the deadline passed.
+    """
+    best = np.zeros(capacity + 1)
+    taken = np.zeros((len(weights), capacity + 1), dtype=bool)
+    for i, (weight, value) in enumerate(zip(weights, values)):
+        if i % 64 == 0 and time.perf_counter() > deadline:
+            return None
+        if weight > capacity:
+            continue
+        candidate = best[:capacity + 1 - weight] + value
+        improved = candidate > best[weight:]
+        taken[i, weight:] = improved
+        best[weight:] = np.where(improved, candidate, best[weight:])
+
+    # Walk the items backwards to recover the choices behind the best value
+    chosen = []
+    remaining = capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if taken[i, remaining]:
+            chosen.append(i)
+            remaining -= weights[i]
+    return np.array(chosen[::-1], dtype=np.intp)
+
+def fill_greedily(costs, order, chosen, residual):
+    """
+    Add the unchosen items that still fit in the residual budget, in the given
+    order, and return the updated mask and residual.
+    """
+    order = order[~chosen[order] & (costs[order] <= residual)]
+    # Stop as soon as nothing further down the order can fit any more
+    remaining_min = np.minimum.accumulate(costs[order][::-1])[::-1]
+    for i, item in enumerate(order):
+        if residual < remaining_min[i]:
+            break
+        if costs[item] <= residual:
+            chosen[item] = True
+            residual -= costs[item]
+    return chosen, residual
+
+def optimize_selection(costs, returns, budget, time_limit=KNAPSACK_TIME_LIMIT):
+    """
+    Select the clients maximizing the total return without exceeding the
+    budget (a 0/1 knapsack problem).
+
+    Small problems are solved exactly by dynamic programming over costs in
+    cents. Larger ones fix the clients far from the cutoff of the best
+    return-per-cost ordering and solve the rest with costs rounded up to a
+    coarse grid, which keeps the selection within budget. The result is
+    compared with the LP relaxation bound to report the optimality gap; if the
+    time limit runs out, the greedy selection is returned.
+    """
+    deadline = time.perf_counter() + time_limit
+    costs = np.asarray(costs, dtype="float64")
+    returns = np.asarray(returns, dtype="float64")
+    valid = np.isfinite(costs) & np.isfinite(returns)
+
+    # Clients that cost nothing and return something are always worth it
+    chosen = valid & (costs <= 0) & (returns >= 0)
+    capacity = budget - costs[chosen].sum()
+    candidates = np.flatnonzero(valid & (costs > 0) & (returns > 0) & (costs <= capacity))
+
+    # Best return per cost first; the greedy cutoff in this order gives both a
+    # feasible selection and the LP relaxation upper bound
+    ratios = returns[candidates] / costs[candidates]
+    order = candidates[np.argsort(-ratios, kind="stable")]
+    cumulative_cost = np.cumsum(costs[order])
+    cutoff = int(np.searchsorted(cumulative_cost, capacity, side="right"))
+    prefix_cost = cumulative_cost[cutoff - 1] if cutoff else 0.0
+    fixed_return = returns[chosen].sum()
+    bound = fixed_return + returns[order[:cutoff]].sum()
+    if cutoff < len(order):
+        bound += (capacity - prefix_cost)*returns[order[cutoff]]/costs[order[cutoff]]
+
+    greedy = chosen.copy()
+    greedy[order[:cutoff]] = True
+    greedy, _ = fill_greedily(costs, order[cutoff:], greedy, capacity - prefix_cost)
+    solution, method = greedy, "greedy"
+
+    if cutoff < len(order):
+        cents = np.round(costs[order]*100)
+        # Only whole cents are solved exactly: rounding sub-cent costs could
+        # overspend the budget
+        integral = np.allclose(cents, costs[order]*100, rtol=0, atol=1e-6)
+        step = int(np.gcd.reduce(cents.astype(np.int64))) if integral else 0
+        steps = int(np.floor(capacity*100 + 1e-6))//step if integral else 0
+
+        if integral and len(order)*(steps + 1) <= KNAPSACK_EXACT_CELLS:
+            picked = solve_knapsack_dp((cents//step).astype(np.int64), returns[order], steps, deadline)
+            if picked is not None:
+                solution = chosen.copy()
+                solution[order[picked]] = True
+                method = "exact"
+        else:
+            lo = max(cutoff - KNAPSACK_CORE_SIZE//2, 0)
+            core = order[lo:lo + KNAPSACK_CORE_SIZE]
+            residual = capacity - (cumulative_cost[lo - 1] if lo else 0.0)
+            unit = residual/KNAPSACK_SCALE_STEPS
+            weights = np.ceil(costs[core]/unit - 1e-9).astype(np.int64)
+            picked = solve_knapsack_dp(weights, returns[core], KNAPSACK_SCALE_STEPS, deadline)
+            if picked is not None:
+                candidate = chosen.copy()
+                candidate[order[:lo]] = True
+                candidate[core[picked]] = True
+                candidate, _ = fill_greedily(costs, order[lo:], candidate, residual - costs[core[picked]].sum())
+                if returns[candidate].sum() > returns[solution].sum():
+                    solution = candidate
+                method = "scaled"
+            else:
+                method = "greedy (time limit)"
+    else:
+        method = "exact"
+
+    total_return = float(returns[solution].sum())
+    gap = 0.0 if method == "exact" or bound <= 0 else max(bound - total_return, 0.0)/bound
+    return {
+        "positions": np.flatnonzero(solution),
+        "cost": float(costs[solution].sum()),
+        "return": total_return,
+        "bound": float(bound),
+        "gap": gap,
+        "method": method,
+    }
+
+@st.cache_resource(max_entries=16)
+def get_optimal_selection(key, available_budget, _financial_data):
+    """
+    Solve the Financial Tool's return-maximizing selection for a budget.
+    """
+    return optimize_selection(
+        _financial_data['Cost'].to_numpy(),
+        _financial_data['Total Client Return'].to_numpy(),
+        available_budget
+    )
+
+@st.cache_resource(max_entries=2)
+def build_ranking_index(key, _data):
+    """
+    Precompute the AI Client Ranking table: its renamed and rounded display
+    columns, the row positions of every branch and client type pair, and the
+    descending order of each sort metric.
+    """
+    table = _data.rename(columns=RANKING_COLUMNS)[list(RANKING_COLUMNS.values())]
+
+    # Metrics are stored as float32, widen them so the rounded values display exactly
+    table['Frequency Orders'] = table['Frequency Orders'].astype('float64').round(2)
+    table['Priority Score'] = table['Priority Score'].astype('float64').round(2)
+    table['Total Net Sales'] = table['Total Net Sales'].round(2)
+    table['Probability of Churn'] = (table['Probability of Churn'].astype('float64')*100).round(2)
+
+    partitions = table.groupby(['Branch ID', 'client_type'], observed=True, dropna=False, sort=False).indices
+    return {
+        "table": table.drop(columns=['client_type']),
+        "branches": _data['branch_id'].dropna().unique().tolist(),
+        "partitions": partitions,
+        "orders": {
+            sort_by: np.argsort(-table[sort_by].to_numpy(), kind="stable")
+            for sort_by in RANKING_SORTS
+        },
+    }
+
+def open_ranking_cursor(ranking_index, branch, client_types, sort_by):
+    """
+    Open a cursor over the positions of the ranking table rows of the given
+    branch ("All" for every branch) and client types, ordered by `sort_by` if
+    set. Sorted rows are only located as pages are read, see `read_cursor`.
+    """
+    partitions = [
+        positions
+        for (branch_id, client_type), positions in ranking_index["partitions"].items()
+        if (branch == "All" or branch_id == branch) and client_type in client_types
+    ]
+    size = len(ranking_index["table"])
+    total = sum(len(positions) for positions in partitions)
+    if total == size:
+        # Every row matches, the precomputed order is the answer
+        positions = ranking_index["orders"][sort_by] if sort_by else np.arange(size)
+        return {"positions": positions, "total": total}
+
+    selected = np.zeros(size, dtype=bool)
+    for positions in partitions:
+        selected[positions] = True
+    if not sort_by:
+        return {"positions": np.flatnonzero(selected), "total": total}
+    return {
+        "positions": np.empty(0, dtype=np.intp),
+        "total": total,
+        "order": ranking_index["orders"][sort_by],
+        "selected": selected,
+        "scanned": 0,
+    }
+
+def read_cursor(cursor, start, stop):
+    """
+    Return the positions from `start` to `stop` of a cursor. A sorted cursor
+    scans its precomputed order just far enough to find the rows asked for,
+    so the first pages are a top-k selection and later pages resume the scan.
+    """
+    stop = min(stop, cursor["total"])
+    while len(cursor["positions"]) < stop:
+        order, selected, scanned = cursor["order"], cursor["selected"], cursor["scanned"]
+        # Size the next chunk from the share of rows that match the filters
+        missing = stop - len(cursor["positions"])
+        chunk = order[scanned:scanned + int(missing*len(order)/cursor["total"]*1.2) + 1024]
+        cursor["positions"] = np.concatenate((cursor["positions"], chunk[selected[chunk]]))
+        cursor["scanned"] = scanned + len(chunk)
+    return cursor["positions"][start:stop]
+
+def show_table_page(name, table, cursor, cursor_key, ranked=False):
+    """
+    Display one page of the `table` rows a cursor selects, with controls to
+    pick the page size and the page. The cursor is kept in the session under
+    `name` and reused while `cursor_key` stays the same, so paging does not
+    filter or sort again. With `ranked`, rows are labeled by their rank.
+    """
+    state = st.session_state
+    if state.get(f"{name}_cursor_key") != cursor_key:
+        state[f"{name}_cursor_key"] = cursor_key
+        state[f"{name}_cursor"] = cursor()
+        state[f"{name}_page"] = 1
+    cursor = state[f"{name}_cursor"]
+    total = cursor["total"]
+
+    col1, col2, col3 = st.columns((0.15, 0.15, 0.7))
+    with col1:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{name}_page_size")
+    pages = max(math.ceil(total/page_size), 1)
+    if state.get(f"{name}_page", 1) > pages:
+        state[f"{name}_page"] = pages
+    with col2:
+        page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{name}_page")
+
+    start = (page - 1)*page_size
+    with timing_span("read page", page_size):
+        positions = read_cursor(cursor, start, start + page_size)
+    with col3:
+        st.write("\n")
+        st.caption(f"Rows {start + 1 if len(positions) else 0} to {start + len(positions)} of {total}")
+
+    page_data = table.iloc[positions]
+    if ranked:
+        page_data = page_data.set_axis(pd.RangeIndex(start, start + len(positions)))
+    with timing_span("render table", len(page_data)):
+        st.dataframe(page_data)
+    return cursor
+
+def write_export(table, positions, extension, out):
+    """
+    Write the `table` rows at `positions` to a binary file in the format of the
+    given extension, converting EXPORT_CHUNK_ROWS rows at a time.
+    """
+    chunks = (
+        table.iloc[positions[start:start + EXPORT_CHUNK_ROWS]]
+        for start in range(0, max(len(positions), 1), EXPORT_CHUNK_ROWS)
+    )
+    if extension == "csv":
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(out, header=i == 0, index=False, mode="wb", encoding="utf-8")
+    elif extension == "parquet":
+        writer = None
+        for chunk in chunks:
+            batch = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, batch.schema)
+            writer.write_table(batch)
+        writer.close()
+    elif extension == "xlsx":
+        # Rows are streamed to the workbook, and spill to a new sheet when one
+        # is full
+        workbook = Workbook(write_only=True)
+        sheet, rows = None, EXCEL_MAX_ROWS
+        for chunk in chunks:
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                if rows == EXCEL_MAX_ROWS:
+                    sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                    sheet.append(list(table.columns))
+                    rows = 0
+                sheet.append(row)
+                rows += 1
+        if sheet is None:
+            workbook.create_sheet("Sheet1").append(list(table.columns))
+        workbook.save(out)
+    else:
+        raise ValueError(f"Unknown export format: {extension}")
+
+def export_rows(table, positions, extension):
+    """
+    Export the `table` rows at `positions` and return the file's bytes for
+    download. The rows are converted into a temporary file a chunk at a time,
+    but Streamlit holds the finished download in memory.
+    """
+    with tempfile.TemporaryFile() as out:
+        write_export(table, positions, extension, out)
+        out.seek(0)
+        return out.read()
+
+def show_export_buttons(name, table, get_positions):
+    """
+    Offer the `table` rows at the positions `get_positions` returns as a
+    download in every export format. Nothing is written until a button is
+    clicked.
+    """
+    columns = st.columns(len(EXPORT_FORMATS))
+    for column, (label, (extension, mime)) in zip(columns, EXPORT_FORMATS.items()):
+        with column:
+            st.download_button(
+                f"Export to {label}",
+                data=lambda extension=extension: export_rows(table, get_positions(), extension),
+                file_name=f"{name}.{extension}",
+                mime=mime,
+                key=f"{name}_export_{extension}",
+                on_click="ignore"
+            )
+
+def downsample_lttb(x, y, threshold):
+    """
+    Pick `threshold` points of a series with the Largest-Triangle-Three-Buckets
+    algorithm, which keeps the peaks and troughs that give the line its shape.
+    Returns the positions of the points kept.
+    """
+    size = len(x)
+    if size <= threshold or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+
+    # The first and last points are kept, the rest is split into buckets
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.intp)
+    edges = np.append(edges, size)
+    kept = np.empty(threshold, dtype=np.intp)
+    kept[0], kept[-1] = 0, size - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Pick the point of the bucket forming the largest triangle with the
+        # previously kept point and the average of the next bucket
+        next_x = x[edges[i + 1]:edges[i + 2]].mean()
+        next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        area = np.abs(
+            (x[previous] - next_x)*(y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop])*(next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+def choose_time_resolution(start, end):
+    """
+    Return the finest resolution, and its period frequency, giving at most
+    TIME_SERIES_MAX_BUCKETS buckets between the `start` and `end` dates.
+    """
+    span_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for resolution, (frequency, days) in TIME_SERIES_RESOLUTIONS.items():
+        if span_days/days <= TIME_SERIES_MAX_BUCKETS:
+            break
+    return resolution, frequency
+
+def aggregate_time_series(orders, start, end):
+    """
+    Total the sales of the orders between the `start` and `end` dates by day,
+    week or month, the finest resolution giving at most TIME_SERIES_MAX_BUCKETS
+    points, then downsample the totals to TIME_SERIES_POINTS points.
+
+    `orders` must be sorted by date. Returns the series and the resolution used.
+    """
+    dates = orders['date_order']
+    window = orders.iloc[
+        dates.searchsorted(pd.Timestamp(start)):dates.searchsorted(pd.Timestamp(end) + pd.Timedelta(days=1))
+    ]
+    resolution, frequency = choose_time_resolution(start, end)
+    buckets = window['date_order'].dt.to_period(frequency).dt.start_time
+    series = window.groupby(buckets)['sales_net'].sum().rename_axis('date_order').reset_index()
+    kept = downsample_lttb(series['date_order'].to_numpy().astype("int64"), series['sales_net'].to_numpy(), TIME_SERIES_POINTS)
+    return series.iloc[kept], resolution
+
+def lookup_clients(client_index, data, client_ids):
+    """
+    Return the rows of the given clients in `data`, in the order asked for,
+    and the IDs that are unknown.
+    """
+    client_ids = np.asarray(client_ids)
+    found = client_index["clients"].get_indexer(client_ids)
+    known = found >= 0
+    rows = data.iloc[client_index["positions"][found[known]]]
+    return rows, client_ids[~known].tolist()
+
+def lookup_orders_batch(order_index, client_ids):
+    """
+    Return the order history rows of all the given clients, gathered from
+    their slices in one take.
+    """
+    orders = order_index["orders"]
+    found = order_index["clients"].get_indexer(np.asarray(client_ids))
+    found = found[found >= 0]
+    starts = order_index["offsets"][found]
+    lengths = order_index["offsets"][found + 1] - starts
+    # Positions of every row of every slice: each slice start, plus the offset
+    # of the row within its slice
+    slice_starts = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - slice_starts, lengths) + np.arange(lengths.sum())
+    return orders.iloc[positions]
+
+def compare_time_series(orders):
+    """
+    Total the sales of several clients on a shared time axis, with one groupby
+    at the resolution fitting their overall date range, then downsample each
+    client's series so the chart holds about TIME_SERIES_POINTS points.
+    """
+    resolution, frequency = choose_time_resolution(orders['date_order'].min(), orders['date_order'].max())
+    buckets = orders['date_order'].dt.to_period(frequency).dt.start_time.rename('date_order')
+    series = orders.groupby([orders['client_id'], buckets])['sales_net'].sum().reset_index()
+
+    clients = series.groupby('client_id', sort=False).indices
+    threshold = max(TIME_SERIES_POINTS//max(len(clients), 1), 100)
+    kept = [
+        positions[downsample_lttb(
+            series['date_order'].to_numpy()[positions].astype("int64"),
+            series['sales_net'].to_numpy()[positions],
+            threshold
+        )]
+        for positions in clients.values()
+    ]
+    return series.iloc[np.concatenate(kept)], resolution
+
+def parse_client_ids(text):
+    """
+    Parse client IDs separated by commas, semicolons, spaces or new lines,
+    dropping repeats. Raises ValueError if one is not a number.
+    """
+    client_ids = [int(token) for token in re.split(r"[\s,;]+", text.strip()) if token]
+    return list(dict.fromkeys(client_ids))
+
+@st.cache_resource(max_entries=2)
+def build_scoring_engine(key, _scoring_data):
+    """
+    Prepare the priority scoring features: the percentile rank of each client
+    on every feature, flipped where a lower value means a higher priority. The
+    scores of each weight vector are memoized in the engine.
+    """
+    features = np.column_stack([
+        _scoring_data[column].rank(pct=True).fillna(0.0).to_numpy(dtype="float32")
+        if direction > 0 else
+        1 - _scoring_data[column].rank(pct=True).fillna(1.0).to_numpy(dtype="float32")
+        for column, (_, direction, _) in SCORING_FEATURES.items()
+    ])
+    return {
+        "clients": pd.Index(_scoring_data['client_id'].to_numpy()),
+        "features": features,
+        "lock": threading.Lock(),
+        "scores": OrderedDict(),
+    }
+
+def score_clients(engine, weights):
+    """
+    Return the priority score of every client, from 0 to 100, as the weighted
+    average of its feature ranks.
+    """
+    with engine["lock"]:
+        scores = engine["scores"].get(weights)
+        if scores is not None:
+            engine["scores"].move_to_end(weights)
+            return scores
+    weights_array = np.asarray(weights, dtype="float32")
+    scores = engine["features"] @ (weights_array*100/weights_array.sum())
+    scores.flags.writeable = False
+    with engine["lock"]:
+        engine["scores"][weights] = scores
+        while len(engine["scores"]) > SCORE_MEMO_SIZE:
+            engine["scores"].popitem(last=False)
+    return scores
+
+def get_priority_scores(weights, versions):
+    """
+    Score every client with the given weights, from the data at the given
+    file versions. Returns the scores and the index mapping client IDs to
+    their positions.
+    """
+    scoring_data = load_data(*SCORING_DATASET, versions.get(SCORING_DATASET[0]))
+    engine = build_scoring_engine(frame_key(scoring_data), scoring_data)
+    return score_clients(engine, weights), engine["clients"]
 
+def align_scores(scores, clients, client_ids):
+    """
+    Return the scores of the given client IDs, NaN for unscored clients.
+    """
+    found = clients.get_indexer(np.asarray(client_ids))
+    return np.where(found >= 0, scores[found], np.nan)
+
+@st.cache_resource(max_entries=8)
+def rescore_ranking_index(key, _ranking_index, _scores, _scored_clients, _client_ids):
+    """
+    Return a ranking index whose Priority Score column and order come from
+    the given scores, aligned to the ranking's `_client_ids`, instead of the
+    precomputed ones.
+    """
+    scores = align_scores(_scores, _scored_clients, _client_ids)
+    table = _ranking_index["table"].assign(**{'Priority Score': np.round(scores.astype("float64"), 2)})
+    orders = dict(_ranking_index["orders"])
+    orders['Priority Score'] = np.argsort(-table['Priority Score'].to_numpy(), kind="stable")
+    return dict(_ranking_index, table=table, orders=orders)
+
+@st.cache_resource(max_entries=8)
+def rescore_financial_table(key, _financial_data, _scores, _scored_clients):
+    """
+    Return the Financial Tool table with its Priority Score column taken from
+    the given scores.
+    """
+    return _financial_data.assign(**{
+        'Priority Score': align_scores(_scores, _scored_clients, _financial_data['Client ID'])
+    })
+
+def show_priority_weights():
+    """
+    Show the sidebar controls to re-weight the priority score. Returns the
+    weights, or None to use the precomputed score.
+    """
+    with st.sidebar.expander("Priority score weights"):
+        if not st.checkbox("Use custom weights", key="custom_weights"):
+            return None
+        weights = tuple(
+            st.slider(label, min_value=0.0, max_value=1.0, value=default, step=0.05, key=f"weight_{column}")
+            for column, (label, _, default) in SCORING_FEATURES.items()
+        )
+        if sum(weights) == 0:
+            st.warning("Set at least one weight above zero.")
+            return None
+        return weights
+
+def rollup_clients(groups):
+    """
+    Count the clients, sales and net revenue of each group of clients.
+    """
+    return groups.agg(
+        clients=('client_id', 'nunique'),
+        orders=('nb_orders', 'sum'),
+        revenue=('tot_sales_net', 'sum'),
+    )
+
+@st.cache_resource(max_entries=2)
+def build_client_summary(key, _data):
+    """
+    Roll up the client table once per data version: the global KPIs, the same
+    KPIs per branch, per client type and per both, and the branch of each
+    client.
+    """
+    client_ids = _data['client_id']
+    first = ~client_ids.duplicated().to_numpy()
+    return {
+        "totals": {
+            "clients": client_ids.nunique(),
+            "orders": _data['nb_orders'].sum(),
+            "revenue": _data['tot_sales_net'].sum(),
+            "branches": _data['branch_id'].nunique(),
+        },
+        "by_branch": rollup_clients(_data.groupby('branch_id', observed=True)),
+        "by_type": rollup_clients(_data.groupby('client_type', observed=True)),
+        "by_branch_type": rollup_clients(_data.groupby(['branch_id', 'client_type'], observed=True)),
+        "branch_of": pd.Series(_data['branch_id'].to_numpy()[first], index=client_ids.to_numpy()[first]),
+    }
+
+@st.cache_resource
+def get_summary_store():
+    """
+    Process-wide store of the monthly revenue aggregates of the order history,
+    per client table they are split by branch with.
+    """
+    return {"lock": threading.Lock(), "update_lock": threading.Lock(), "monthly": OrderedDict()}
+
+def aggregate_monthly_revenue(orders, branch_of):
+    """
+    Total the sales of the order rows by branch and month.
+    """
+    return orders.groupby(
+        [branch_of.reindex(orders['client_id']).to_numpy(), orders['date_order'].dt.to_period('M').dt.start_time],
+        dropna=False
+    )['sales_net'].sum()
+
+class BoundedReader(io.RawIOBase):
+    """
+    Read a binary file from its current position up to the byte offset `end`.
+    """
+
+    def __init__(self, f, end):
+        self.f = f
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.f.tell())
+        if size <= 0:
+            return 0
+        return self.f.readinto(memoryview(buffer)[:size])
+
+def complete_lines_end(file_path, size):
+    """
+    Return the offset just past the last newline before byte `size` of a
+    file, so a partially written last line is left out. 0 if there is none.
+    """
+    with open(file_path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(end - 65536, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+def read_monthly_revenue(file_path, branch_of, offset=None, columns=None):
+    """
+    Total the sales of the order history by branch and month, in chunks. Only
+    the complete lines present when the read starts are parsed, so a partially
+    written last line, or rows appended meanwhile, are left for the next
+    update. With an `offset`, only the lines after that byte are read, parsed
+    with the header `columns`. Returns the totals (None if there are no new
+    rows), the offset reached and the columns.
+    """
+    end = complete_lines_end(file_path, os.stat(file_path).st_size)
+    if offset is None:
+        columns = pd.read_csv(file_path, nrows=0).columns.tolist()
+        start, names, header = 0, None, 0
+    elif end <= offset:
+        return None, offset, columns
+    else:
+        start, names, header = offset, columns, None
+
+    schema = DATASET_SCHEMAS["top_client_data.csv"]
+    with open(file_path, "rb", buffering=0) as f:
+        f.seek(start)
+        reader = pd.read_csv(
+            io.BufferedReader(BoundedReader(f, end)),
+            header=header,
+            names=names,
+            usecols=['client_id', 'date_order', 'sales_net'],
+            chunksize=READ_CHUNK_ROWS
+        )
+        totals = [aggregate_monthly_revenue(apply_schema(chunk, schema), branch_of) for chunk in reader]
+    if not totals:
+        return None, end, columns
+    return pd.concat(totals).groupby(level=[0, 1], dropna=False).sum(), end, columns
+
+def tail_digest(file_path, offset):
+    """
+    Hash the last bytes before `offset`, to tell whether a file was appended
+    to or rewritten.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(max(offset - 65536, 0))
+        return hashlib.blake2b(f.read(offset - f.tell()), digest_size=16).hexdigest()
+
+def get_monthly_revenue(file_path, summary, refresh=False):
+    """
+    Return the net revenue of the order history by branch and month.
+
+    The totals are kept per process. With `refresh`, the file is checked for
+    changes: when orders were appended to it, only the new rows are parsed
+    and added to the totals; any other change rebuilds them. A new client
+    table rebuilds them too. Reads of the file happen outside the store's
+    lock, so reruns reading the current totals never wait for them.
+    """
+    # Totals are split by branch, so each client table has its own, and the
+    # ones of a new table are built while the current ones are still served
+    store = get_summary_store()
+    key = (file_path, id(summary["branch_of"]))
+    with store["lock"]:
+        state = store["monthly"].get(key)
+    if state is not None and state["branch_of"] is not summary["branch_of"]:
+        state = None
+    if state is not None and not refresh:
+        return monthly_revenue_frame(state["revenue"])
+
+    # Only one update reads the file at a time
+    with store["update_lock"]:
+        with store["lock"]:
+            state = store["monthly"].get(key)
+        if state is not None and state["branch_of"] is not summary["branch_of"]:
+            state = None
+
+        stat = os.stat(file_path)
+        fingerprint = (stat.st_size, stat.st_mtime_ns)
+        if state is not None and state["fingerprint"] == fingerprint:
+            return monthly_revenue_frame(state["revenue"])
+
+        if state is not None:
+            if stat.st_size >= state["offset"] and tail_digest(file_path, state["offset"]) == state["digest"]:
+                added, offset, _ = read_monthly_revenue(
+                    file_path, summary["branch_of"], state["offset"], state["columns"]
+                )
+                revenue = state["revenue"]
+                if added is not None:
+                    revenue = added if revenue is None else revenue.add(added, fill_value=0)
+                state = dict(state, revenue=revenue, offset=offset)
+            else:
+                state = None
+
+        if state is None:
+            revenue, offset, columns = read_monthly_revenue(file_path, summary["branch_of"])
+            state = {"revenue": revenue, "offset": offset, "columns": columns, "branch_of": summary["branch_of"]}
+        state["fingerprint"] = fingerprint
+        state["digest"] = tail_digest(file_path, state["offset"])
+        with store["lock"]:
+            store["monthly"][key] = state
+            store["monthly"].move_to_end(key)
+            # Keep the totals of the current and the next client table
+            while len(store["monthly"]) > 2:
+                store["monthly"].popitem(last=False)
+
+    return monthly_revenue_frame(state["revenue"])
+
+def monthly_revenue_frame(revenue):
+    """
+    Turn the monthly revenue totals into a frame of branch, month and sales.
+    """
+    if revenue is None:
+        return pd.DataFrame({'branch_id': [], 'month': pd.to_datetime([]), 'sales_net': []})
+    return revenue.rename_axis(['branch_id', 'month']).reset_index()
+
+def load_tab_data(tab, versions):
+    """
+    Load the datasets the given tab reads, pruned to the columns it uses, at
+    the given file versions.
+    """
+    return {
+        name: load_data(file_path, usecols, versions.get(file_path))
+        for name, (file_path, usecols) in TAB_DATASETS[tab].items()
+    }
+
+def validate_dataset(file_path, frame):
+    """
+    Check a newly read dataset before it is published. Raises ValueError if it
+    is empty, lacks a column the tabs read, or has rows without a client_id.
+    """
+    required = {
+        column
+        for datasets in TAB_DATASETS.values()
+        for path, usecols in datasets.values() if path == file_path
+        for column in usecols
+    }
+    missing = required - set(frame.columns)
+    if missing:
+        raise ValueError(f"{file_path} lacks the columns {', '.join(sorted(missing))}")
+    if frame.empty:
+        raise ValueError(f"{file_path} has no rows")
+    if frame['client_id'].isna().any():
+        raise ValueError(f"{file_path} has rows without a client_id")
+
+def warm_tab(tab, versions):
+    """
+    Load the datasets of a tab at the given versions and build everything its
+    reruns derive from them, so they find it all cached.
+    """
+    datasets = load_tab_data(tab, versions)
+    if tab == "Home Page":
+        summary = build_client_summary(frame_key(datasets["data"]), datasets["data"])
+        get_monthly_revenue(ORDER_HISTORY_FILE, summary, refresh=True)
+    elif tab == "AI Client Ranking":
+        build_ranking_index(frame_key(datasets["data"]), datasets["data"])
+        scoring_data = load_data(*SCORING_DATASET, versions.get(SCORING_DATASET[0]))
+        build_scoring_engine(frame_key(scoring_data), scoring_data)
+    elif tab == "Client Deep-dive":
+        build_client_index(frame_key(datasets["data"]), datasets["data"])
+        build_order_index(frame_key(datasets["time_data"]), datasets["time_data"])
+    elif tab == "Financial Tool":
+        financial_key = frame_key(datasets["financial_data"])
+        financial_data = build_financial_table(financial_key, datasets["financial_data"])
+        for sorting_criterion in FINANCIAL_SORTS:
+            get_budget_curve(financial_key, sorting_criterion, financial_data)
+
+@st.cache_resource
+def get_snapshot_store():
+    """
+    Process-wide holder of the published data snapshot: the version of every
+    data file that reruns read. It is replaced as a whole when new data is
+    ready, so a rerun sees either the old or the new snapshot.
+    """
+    return {"snapshot": None, "failed": None, "error": None, "ready": threading.Event()}
+
+def stage_version(file_path, version):
+    """
+    Validate a new version of a data file and add it to the store. A version
+    not yet in the store is parsed privately, outside the data cache, and
+    only stored once it is valid.
+    """
+    if os.path.exists(store_path(file_path, version)):
+        validate_dataset(file_path, read_data(file_path, version=version))
+        return
+    frame = parse_csv(file_path, version=version)
+    validate_dataset(file_path, frame)
+    try:
+        write_to_store(file_path, version, frame)
+    except OSError:
+        # Without a writable store, reruns parse the file in-process
+        logger.warning("Could not add %s to the data store", file_path)
+
+def refresh_snapshot(store):
+    """
+    Publish a new snapshot if a data file changed. The changed files are
+    validated, then every tab is warmed, so reruns find everything built as
+    soon as the snapshot is swapped in. If a file is invalid, the current
+    snapshot stays and the error is kept. The first snapshot is published
+    before warming, so the first reruns do not wait for every tab.
+    """
+    versions = {file_path: dataset_version(file_path) for file_path in DATA_FILES}
+    snapshot = store["snapshot"]
+    published = snapshot["versions"] if snapshot is not None else {}
+    if versions == published or versions == store["failed"]:
+        return
+
+    try:
+        for file_path, version in versions.items():
+            if published.get(file_path) != version:
+                stage_version(file_path, version)
+    except Exception as error:
+        logger.exception("Data refresh failed, keeping the current snapshot")
+        store["failed"], store["error"] = versions, str(error)
+        drop_stale_frames(published)
+        return
+
+    if snapshot is not None:
+        warm_tabs(versions)
+
+    store["snapshot"] = {
+        "versions": versions,
+        "id": hashlib.blake2b("".join(sorted(versions.values())).encode(), digest_size=4).hexdigest(),
+        "published_at": datetime.now(),
+    }
+    store["failed"], store["error"] = None, None
+    store["ready"].set()
+    drop_stale_frames(versions)
+    logger.info("Published data snapshot %s", store["snapshot"]["id"])
+
+    if snapshot is None:
+        warm_tabs(versions)
+
+def warm_tabs(versions):
+    """
+    Warm every tab at the given versions, the Home Page first, logging the
+    tabs that fail.
+    """
+    for tab in TAB_DATASETS:
+        try:
+            warm_tab(tab, versions)
+        except Exception:
+            logger.exception("Could not warm the %s tab", tab)
+
+def refresh_data():
+    """
+    Keep the data snapshot up to date, checking the data files every
+    DATA_REFRESH_SECONDS.
+    """
+    store = get_snapshot_store()
+    while True:
+        try:
+            refresh_snapshot(store)
+        except Exception as error:
+            logger.exception("Data refresh failed")
+            store["error"] = str(error)
+        store["ready"].set()
+        time.sleep(DATA_REFRESH_SECONDS)
+
+@st.cache_resource
+def start_data_refresher():
+    """
+    Start the background thread refreshing the data snapshot, once per process.
+    """
+    thread = threading.Thread(target=refresh_data, name="data-refresher", daemon=True)
+
+    # The refresher calls cached builders outside of any script run by design,
+    # silence Streamlit's warning about it for that thread only
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context",
+                 "streamlit.runtime.scriptrunner.script_run_context"):
+        logging.getLogger(name).addFilter(lambda record: record.threadName != thread.name)
+
+    thread.start()
+    return thread
+
+def current_snapshot():
+    """
+    Return the published data snapshot, waiting for the first one if the
+    process just started. None if no data could be loaded.
+    """
+    start_data_refresher()
+    store = get_snapshot_store()
+    if not store["ready"].is_set():
+        with st.spinner("Loading data..."):
+            store["ready"].wait()
+    return store["snapshot"]
+
+def main():
     # Set page configuration
     st.set_page_config(
         page_title="CLIENTCO - Clients Analytics, Sales Team Tool",
@@ -21,12 +1667,24 @@ def main():
         initial_sidebar_state="expanded"
     )
 
-    # Increase the maximum number of elements allowed to be styled
-    pd.set_option("styler.render.max_elements", 5989816)
-
     # Create sidebar navigation for tabs
     tab = st.sidebar.radio("Navigation", ["Home Page", "AI Client Ranking", "Client Deep-dive","Financial Tool"])
 
+    # Custom priority score weights, used by the ranking and financial tabs
+    priority_weights = show_priority_weights()
+
+    # Opt-in stage timings and profiling of this rerun, stopped however the
+    # rerun ends
+    start_profiling(show_debug_panel())
+    try:
+        show_tab(tab, priority_weights)
+    finally:
+        finish_profiling(tab)
+
+def show_tab(tab, priority_weights):
+    """
+    Show the sidebar footer, the data snapshot and the selected tab.
+    """
     # At the bottom of the sidebar
     with st.sidebar:
         for _ in range(100): 
@@ -35,7 +1693,22 @@ def main():
         st.image(logo_image2, use_column_width=True)
 
 
+    # Read the data snapshot published by the background refresher
+    snapshot = current_snapshot()
+    store = get_snapshot_store()
+    if snapshot is None:
+        st.error(f"The data could not be loaded: {store['error']}")
+        st.stop()
+    st.sidebar.caption(f"Data version {snapshot['id']}, published {snapshot['published_at']:%Y-%m-%d %H:%M:%S}")
+    if store["error"]:
+        st.sidebar.warning(f"Newer data was rejected: {store['error']}")
+
+    # Load only the datasets and columns the selected tab reads
+    with timing_span("load data"):
+        datasets = load_tab_data(tab, snapshot["versions"])
+
     if tab == "Home Page":
+        data = datasets["data"]
 
         # Create columns for layout
         t1, t2 = st.columns((0.07, 0.35))
@@ -71,11 +1744,21 @@ def main():
 
         st.subheader("**CLIENTCO over the last two years**")
 
-        # Calculate basic statistics
-        total_clients = data['client_id'].nunique()
-        total_sales = data['nb_orders'].sum()
-        sales_net_revenue = data['tot_sales_net'].sum()
-        number_branches = data['branch_id'].nunique()
+        # Read the statistics off the rollups built once per data version
+        with timing_span("client summary", len(data)):
+            summary = build_client_summary(frame_key(data), data)
+
+        branches = ['All'] + sorted(summary["by_branch"].index.tolist())
+        selected_branch = st.selectbox("Select Branch", branches, index=0)
+
+        if selected_branch == "All":
+            kpis = summary["totals"]
+        else:
+            kpis = summary["by_branch"].loc[selected_branch]
+        total_clients = int(kpis['clients'])
+        total_sales = int(kpis['orders'])
+        sales_net_revenue = float(kpis['revenue'])
+        number_branches = summary["totals"]["branches"]
 
         # Display basic statistics
         st.markdown(f"""
@@ -120,9 +1803,40 @@ def main():
             <h2>{number_branches}</h2>
         </div>
         """, unsafe_allow_html=True)
+
+        st.write("\n")
+
+        # Rollup by client type and monthly revenue trend
+        col1, col2 = st.columns((0.4, 0.6))
+        with col1:
+            st.subheader("Clients by type")
+            by_type = summary["by_type"] if selected_branch == "All" else summary["by_branch_type"].loc[selected_branch]
+            st.dataframe(by_type.rename(columns={'clients': 'Clients', 'orders': 'Sales', 'revenue': 'Net Revenue'}).round(2))
+        with col2:
+            st.subheader("Monthly net revenue")
+            with timing_span("monthly revenue") as span:
+                monthly_revenue = get_monthly_revenue(ORDER_HISTORY_FILE, summary)
+                span.rows = len(monthly_revenue)
+            if selected_branch != "All":
+                monthly_revenue = monthly_revenue[monthly_revenue['branch_id'] == selected_branch]
+            monthly_revenue = monthly_revenue.groupby('month', as_index=False)['sales_net'].sum()
+            if not monthly_revenue.empty:
+                with timing_span("build figure", len(monthly_revenue)):
+                    fig = px.line(
+                        monthly_revenue,
+                        x='month',
+                        y='sales_net',
+                        labels={'month': 'Month', 'sales_net': 'Net Revenue'}
+                    )
+                with timing_span("render figure"):
+                    st.plotly_chart(fig)
+            else:
+                st.warning("No order history available for this branch.")
     
 
     elif tab == "AI Client Ranking":
+        data = datasets["data"]
+
         # Create columns for layout
         t1, t2 = st.columns((0.07, 0.35))
 
@@ -142,43 +1856,25 @@ def main():
 
         st.write("\n")
 
+        # Partition, derive and sort the ranking table once per data version
+        ranking_key = frame_key(data)
+        with timing_span("ranking index", len(data)):
+            ranking_index = build_ranking_index(ranking_key, data)
+
+        # Re-score the ranking with the custom weights, if any
+        if priority_weights is not None:
+            with timing_span("priority scores", len(data)):
+                scores, scored_clients = get_priority_scores(priority_weights, snapshot["versions"])
+            ranking_key = (ranking_key, priority_weights)
+            with timing_span("rescore ranking", len(data)):
+                ranking_index = rescore_ranking_index(ranking_key, ranking_index, scores, scored_clients, data['client_id'])
+
         # Get unique branches from the dataset
-        branches = ['All'] + data['branch_id'].unique().tolist()
+        branches = ['All'] + ranking_index["branches"]
 
         # Create selectbox for branch selection
         selected_branch = st.selectbox("Select Branch", branches, index=0)  # Set "All" as default option
 
-        # Filter data based on selected branch
-        if selected_branch == "All":
-            filtered_data = data
-        else:
-            filtered_data = data[data['branch_id'] == selected_branch]
-
-        # Rename and select columns
-        display_columns = {
-            'client_id': 'Client ID',
-            'branch_id': 'Branch ID',
-            'priority_score':'Priority Score',
-            'churn_probability': 'Probability of Churn',
-            'tot_sales_net': 'Total Net Sales',
-            'avg_freq_orders': 'Frequency Orders',
-            'lag_day_last': 'Days since Last Order',
-            'pref_cont_method': 'Preferred Way of Contact',
-            'client_type' : 'client_type'
-        }
-
-        filtered_data = filtered_data.rename(columns=display_columns)[display_columns.values()]
-
-        filtered_data['Frequency Orders'] = filtered_data['Frequency Orders'].round(2)
-
-        filtered_data['Priority Score'] = filtered_data['Priority Score'].round(2)
-
-        filtered_data['Total Net Sales'] = filtered_data['Total Net Sales'].round(2)
-
-        filtered_data['Probability of Churn'] = filtered_data['Probability of Churn']*100
-
-        filtered_data['Probability of Churn'] = filtered_data['Probability of Churn'].round(2)
-
         # Filter clients based on type
         client_types = ['Recurrent', 'Occasional', 'New']
         selected_client_types = st.multiselect('Filter by Client Type', client_types, default=client_types)
@@ -190,25 +1886,28 @@ def main():
             'New': 'new_client'
         }
 
-        # Filter data based on selected client types
-        filtered_data = filtered_data[filtered_data['client_type'].isin([type_mapping[type_] for type_ in selected_client_types])]
+        # Sort data by 'Probability of Churn' and 'Total Sales Net'
+        sort_by = st.selectbox("Sort by", [""] + RANKING_SORTS)
 
-        # Remove the 'client_type' column from the displayed data
-        filtered_data = filtered_data.drop(columns=['client_type'])
+        selected_types = [type_mapping[type_] for type_ in selected_client_types]
 
-        # Sort data by 'Probability of Churn' and 'Total Sales Net'
-        sort_by = st.selectbox("Sort by", ["", "Priority Score", "Probability of Churn", "Total Net Sales"])
-        if sort_by:
-            if sort_by == "Priority Score":
-                filtered_data = filtered_data.sort_values(by="Priority Score", ascending=False)
-            elif sort_by == "Probability of Churn":
-                filtered_data = filtered_data.sort_values(by="Probability of Churn", ascending=False)
-            elif sort_by == "Total Net Sales":
-                filtered_data = filtered_data.sort_values(by="Total Net Sales", ascending=False)
-
-        # Display filtered data
+        # Display filtered data, a page at a time. The branch and client type
+        # partitions are combined in the chosen order only when filters change.
         st.write("Clients of the selected branch:")
-        st.write(filtered_data)
+        cursor = show_table_page(
+            "ranking",
+            ranking_index["table"],
+            lambda: open_ranking_cursor(ranking_index, selected_branch, selected_types, sort_by),
+            (ranking_key, selected_branch, tuple(selected_types), sort_by)
+        )
+
+        # Export every row of the ranking, reading a copy of the cursor so
+        # the download doesn't touch the one paging uses
+        show_export_buttons(
+            "client_ranking",
+            ranking_index["table"],
+            lambda: read_cursor(dict(cursor), 0, cursor["total"])
+        )
 
         st.write("\n")
         st.write("\n")
@@ -220,9 +1919,14 @@ def main():
         - **Branch Filter**: Filter that allows the filtering by branch. Each sales manager can focus on their specific branch or on the company as a whole.
         - **Customer Filter**: Clients are segmented into three different buckets: new customers (did their first order in the last month), occasional customers (did 2 or less orders), recurrent buyers (rest of the clients, considered as loyal clients).
         - **Sort By Filter**: Possibility to sort clients based on their churn probability, amount of sales net revenue, priority score.
+        - **Priority Score Weights**: In the sidebar, re-weight the priority score from churn probability, net sales, order frequency, recency and number of orders. The ranking and the financial tool then use the new score.
+        - **Export**: Download every client of the filtered and sorted ranking as CSV, Parquet or Excel.
         """)
 
     elif tab == "Client Deep-dive":
+        data = datasets["data"]
+        time_data = datasets["time_data"]
+
         # Create columns for layout
         t1, t2 = st.columns((0.07, 0.35))
 
@@ -246,8 +1950,10 @@ def main():
         branches = ['All'] + sorted(data['branch_id'].unique().tolist())
         selected_branch = st.selectbox("Select Branch", branches, index=0)
 
-        if selected_branch != "All":
-            data = data[data['branch_id'] == selected_branch]
+        # Index clients and their order history once per data version
+        with timing_span("client indexes", len(data) + len(time_data)):
+            client_index = build_client_index(frame_key(data), data)
+            order_index = build_order_index(frame_key(time_data), time_data)
 
         client_id = st.text_input("Enter Client ID:")
 
@@ -256,10 +1962,14 @@ def main():
         if client_id:
             try:
                 client_id = int(client_id)
-                client_data = data[data['client_id'] == client_id]
+                with timing_span("client lookup"):
+                    client_data = lookup_client(client_index, data, client_id)
+
+                # Clients of other branches are hidden by the branch filter
+                if client_data is not None and selected_branch != "All" and client_data['branch_id'] != selected_branch:
+                    client_data = None
 
-                if not client_data.empty:
-                    client_data = client_data.iloc[0]
+                if client_data is not None:
 
                     # Calculate and display the three principal metrics in boxes
                     col1, col2, col3 = st.columns(3)
@@ -320,17 +2030,41 @@ def main():
 
                     # Plot time series data
                     st.subheader("Time Series Data: Sales Net Over Time")
-                    client_time_data = time_data[time_data['client_id'] == client_id]
+                    with timing_span("order lookup") as span:
+                        client_time_data = lookup_orders(order_index, client_id)
+                        span.rows = len(client_time_data)
                     if not client_time_data.empty:
-                        fig = px.line(
-                            client_time_data, 
-                            x='date_order', 
-                            y='sales_net', 
-                            title=f'Time Series: Sales Net Over Time (Client ID: {client_id})',
-                            labels={'date_order': 'Date Order', 'sales_net': 'Total Net Sales'} 
-                        )
-
-                        st.plotly_chart(fig)
+                        client_time_data = client_time_data.sort_values('date_order', kind='stable')
+
+                        # Zooming in re-aggregates the visible window at a finer resolution
+                        first_day = client_time_data['date_order'].iloc[0].date()
+                        last_day = client_time_data['date_order'].iloc[-1].date()
+                        visible_range = (first_day, last_day)
+                        if first_day < last_day:
+                            visible_range = st.slider(
+                                "Visible range:",
+                                min_value=first_day,
+                                max_value=last_day,
+                                value=(first_day, last_day),
+                                format="YYYY-MM-DD",
+                                key=f"time_range_{client_id}"
+                            )
+
+                        with timing_span("aggregate series", len(client_time_data)):
+                            series, resolution = aggregate_time_series(client_time_data, *visible_range)
+                        with timing_span("build figure", len(series)):
+                            fig = px.line(
+                                series, 
+                                x='date_order', 
+                                y='sales_net', 
+                                title=f'Time Series: Sales Net Over Time (Client ID: {client_id})',
+                                labels={'date_order': 'Date Order', 'sales_net': 'Total Net Sales'},
+                                render_mode='webgl'
+                            )
+
+                        with timing_span("render figure"):
+                            st.plotly_chart(fig)
+                        st.caption(f"{resolution} totals, {len(series)} points shown.")
                     else:
                         st.warning("No time series data available for this client.")
                 else:
@@ -340,14 +2074,76 @@ def main():
         
         st.write("")
 
+        # Compare several clients, looked up together in one batch
+        st.subheader("Compare Clients")
+        compare_by = st.radio("Clients to compare", ["Client IDs", "Top clients by Priority Score"], horizontal=True)
+
+        compare_ids = []
+        if compare_by == "Client IDs":
+            ids_text = st.text_area("Enter Client IDs (separated by commas or new lines):")
+            try:
+                compare_ids = parse_client_ids(ids_text)[:MAX_COMPARED_CLIENTS]
+            except ValueError:
+                st.error("Client IDs must be numbers.")
+        else:
+            top_n = st.number_input("Number of clients:", min_value=1, max_value=MAX_COMPARED_CLIENTS, value=10, step=1)
+            branch_data = data if selected_branch == "All" else data[data['branch_id'] == selected_branch]
+            with timing_span("top clients", len(branch_data)):
+                compare_ids = branch_data.nlargest(top_n, 'priority_score')['client_id'].tolist()
+
+        if compare_ids:
+            with timing_span("compare lookup", len(compare_ids)):
+                compare_data, missing_ids = lookup_clients(client_index, data, compare_ids)
+            if selected_branch != "All":
+                in_branch = (compare_data['branch_id'] == selected_branch).to_numpy()
+                missing_ids += compare_data['client_id'][~in_branch].tolist()
+                compare_data = compare_data[in_branch]
+            if missing_ids:
+                st.warning(f"Client IDs not found in the dataset: {', '.join(map(str, missing_ids))}")
+
+            if not compare_data.empty:
+                compare_table = compare_data.rename(columns=COMPARE_COLUMNS)[list(COMPARE_COLUMNS.values())]
+                compare_table['Probability of Churn'] = compare_table['Probability of Churn'].astype('float64')*100
+                st.dataframe(compare_table.round(2), hide_index=True)
+
+                with timing_span("compare order lookup") as span:
+                    compare_orders = lookup_orders_batch(order_index, compare_data['client_id'].to_numpy())
+                    span.rows = len(compare_orders)
+                if not compare_orders.empty:
+                    with timing_span("compare series", len(compare_orders)):
+                        series, resolution = compare_time_series(compare_orders)
+                    series = series.assign(client_id=series['client_id'].astype(str))
+                    layout = st.radio("Chart layout", ["Overlay", "Small multiples"], horizontal=True)
+                    with timing_span("build figure", len(series)):
+                        fig = px.line(
+                            series,
+                            x='date_order',
+                            y='sales_net',
+                            color='client_id',
+                            facet_col='client_id' if layout == "Small multiples" else None,
+                            facet_col_wrap=4,
+                            title='Time Series: Sales Net Over Time (Compared Clients)',
+                            labels={'date_order': 'Date Order', 'sales_net': 'Total Net Sales', 'client_id': 'Client ID'},
+                            render_mode='webgl'
+                        )
+                    with timing_span("render figure"):
+                        st.plotly_chart(fig)
+                    st.caption(f"{resolution} totals on a shared time axis.")
+                else:
+                    st.warning("No time series data available for these clients.")
+
+        st.write("")
+
         st.subheader("Functionalities explanations:")
 
         st.markdown("""
         - **Branch Filter**: Filter that allows the filtering by branch. Each sales manager can focus on their specific branch or on the company as a whole.
         - **Customer Filter**: Input the number of the client we want to do a deep-dive on.
+        - **Compare Clients**: Paste several client IDs, or pick the top clients by priority score of the branch, to compare their metrics and sales over time side by side.
         """)
         
     elif tab == "Financial Tool":
+        financial_data = datasets["financial_data"]
 
         # Create columns for layout
         t1, t2 = st.columns((0.07, 0.35))
@@ -368,48 +2164,71 @@ def main():
 
         st.write("\n")
 
-        # Rename and select columns
-
-        display_columns = {
-            'client_id': 'Client ID',
-            'branch_id': 'Branch ID',
-            'priority_score':'Priority Score',
-            'churn_probability': 'Probability of Churn',
-            'tot_sales_net': 'Total Net Sales',
-            'tot_client_cost': 'Total Client Cost',
-            'return_client':'Total Client Return',
-            'pref_cont_method':'Contact',
-            'cost':'Cost'
-        }
-
-        # Apply column renaming and selection
-        financial_data = financial_data.rename(columns=display_columns)[display_columns.values()]
-
-        financial_data = financial_data[financial_data['Contact'].isin(['Phone', 'Visit'])]
+        # Renamed columns of the Phone and Visit clients, built once per data version
+        financial_key = frame_key(financial_data)
+        with timing_span("financial table", len(financial_data)):
+            financial_data = build_financial_table(financial_key, financial_data)
+
+        # Re-score the clients with the custom weights, if any
+        if priority_weights is not None:
+            with timing_span("priority scores", len(financial_data)):
+                scores, scored_clients = get_priority_scores(priority_weights, snapshot["versions"])
+            # The scores come from the client table, so its version is part
+            # of the key too
+            financial_key = (financial_key, priority_weights, snapshot["versions"].get(SCORING_DATASET[0]))
+            with timing_span("rescore clients", len(financial_data)):
+                financial_data = rescore_financial_table(financial_key, financial_data, scores, scored_clients)
+
+        # Choose between a single budget, a sweep over every budget and the
+        # selection maximizing the return
+        mode = st.radio("Mode", ["Single budget", "Budget sweep", "Optimize return"], horizontal=True)
 
         # Add input for available budget
-        available_budget = st.number_input("Available Budget:", min_value=0.0, format='%f')
-
-        # Add a selectbox for the sorting criteria
-        sorting_criterion = st.selectbox("Sort by", ["Priority Score", "Total Client Return"], index=0)
-
-        # Sort the data by the selected criterion in descending order
-        financial_data_sorted = financial_data.sort_values(by=sorting_criterion, ascending=False)
+        if mode != "Budget sweep":
+            available_budget = st.number_input("Available Budget:", min_value=0.0, format='%f')
 
-        # Initialize a list to keep track of selected clients and a running total of the cost
-        selected_clients = []
-        total_cost = 0
+        if mode == "Optimize return":
+            with timing_span("optimize selection", len(financial_data)):
+                solution = get_optimal_selection(financial_key, available_budget, financial_data)
+            selected_positions = solution["positions"]
+            selected_count, total_cost, total_return = len(selected_positions), solution["cost"], solution["return"]
 
-        # Loop through sorted clients and select them until the budget is reached
-        for _, row in financial_data_sorted.iterrows():
-            if total_cost + row['Cost'] <= available_budget:
-                selected_clients.append(row['Client ID'])
-                total_cost += row['Cost']
+            if solution["method"] == "exact":
+                st.caption("Optimal selection (exact solver).")
             else:
-                break  # Stop if we reach or exceed the budget
-
-        # Calculate total return from selected clients
-        total_return = financial_data_sorted[financial_data_sorted['Client ID'].isin(selected_clients)]['Total Client Return'].sum()
+                st.caption(f"Near-optimal selection ({solution['method']} solver): at most {solution['gap']:.2%} below the best achievable return.")
+        else:
+            # Add a selectbox for the sorting criteria
+            sorting_criterion = st.selectbox("Sort by", FINANCIAL_SORTS, index=0)
+
+            # Sort the clients by the selected criterion once per data version
+            # and precompute the selection for every budget and the sweep
+            with timing_span("budget curve", len(financial_data)):
+                curve = get_budget_curve(financial_key, sorting_criterion, financial_data)
+
+        if mode == "Budget sweep":
+            sweep = curve["sweep"]
+            with timing_span("build figure", len(sweep)):
+                fig = px.line(
+                    sweep,
+                    x='Budget',
+                    y='Expected total return (1y)',
+                    hover_data=['Clients', 'Expected clients back'],
+                    line_shape='hv',
+                    title=f'Expected total return (1y) by budget, clients sorted by {sorting_criterion}'
+                )
+            with timing_span("render figure"):
+                st.plotly_chart(fig)
+
+            # Any budget is read off the precomputed curve without re-selecting
+            max_budget = float(sweep['Budget'].iloc[-1])
+            available_budget = st.slider("Read budget off the curve:", min_value=0.0, max_value=max(max_budget, 1.0), value=max_budget/2)
+
+        if mode != "Optimize return":
+            # Select clients in sorted order until the next one exceeds the budget
+            with timing_span("read budget curve"):
+                selected_count, total_cost, total_return = read_budget_curve(curve, available_budget)
+            selected_positions = curve["order"][:selected_count]
 
         # Display the total number of clients and total return in two columns
         col1, col2, col3 = st.columns(3)
@@ -417,14 +2236,14 @@ def main():
             st.markdown(f"""
                 <div style="border: 2px solid #2196F3; border-radius: 5px; padding: 10px;">
                     <h4 style="color: #2196F3;">Total number of clients:</h4>
-                    <h3 style="color: #2196F3;">{len(selected_clients)}</h3>
+                    <h3 style="color: #2196F3;">{selected_count}</h3>
                 </div>
             """, unsafe_allow_html=True)
         with col2:
             st.markdown(f"""
                 <div style="border: 2px solid #2196F3; border-radius: 5px; padding: 10px;">
                     <h4 style="color: #2196F3;">Expected clients back:</h4>
-                    <h3 style="color: #2196F3;">{round(len(selected_clients)*0.85)}</h3>
+                    <h3 style="color: #2196F3;">{round(selected_count*0.85)}</h3>
                 </div>
             """, unsafe_allow_html=True)
         with col3:
@@ -437,11 +2256,17 @@ def main():
 
         # Check if there are any selected clients and display them
 
-        if selected_clients:  # Check if there are any selected clients
-            selected_data = financial_data_sorted[financial_data_sorted['Client ID'].isin(selected_clients)]
-
-            # Display the DataFrame without the index
-            st.dataframe(selected_data.reset_index(drop=True))
+        if selected_count:  # Check if there are any selected clients
+            # Display the selected clients a page at a time, labeled by rank
+            # when they follow a sort order
+            show_table_page(
+                "financial",
+                financial_data,
+                lambda: {"positions": selected_positions, "total": selected_count},
+                (financial_key, mode, sorting_criterion if mode != "Optimize return" else None, available_budget),
+                ranked=mode != "Optimize return"
+            )
+            show_export_buttons("budget_selection", financial_data, lambda: selected_positions)
     
         # After displaying the filtered data table
         st.subheader("Functionalities explanations:")
@@ -449,9 +2274,10 @@ def main():
         st.markdown("""
         - **Available Budget**: Input of the available budget we have to reach to clients.
         - **Sort By Filter**: Filter that allows to sort use the budget prioritising clients by their priority rate or by their total return.
+        - **Optimize Return**: Picks the clients that maximize the total return within the available budget, instead of following a sort order.
+        - **Budget Sweep**: Shows the expected return for every budget at once, to find the point where spending more stops paying back. Any budget can then be read off the curve.
         """)
 
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Import the app module from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handover  # noqa: E402
+
+
+@pytest.fixture
+def write_orders():
+    """
+    Return a function writing orders to a CSV laid out like the order
+    history, and returning the file's version. Orders are (client_id,
+    date_order, sales_net) tuples, or bare client IDs, ordered on successive
+    days for the row number.
+    """
+    def write(path, orders, mode="w", start=0):
+        orders = [
+            order if isinstance(order, tuple) else
+            (order, str((pd.Timestamp("2020-01-01") + pd.Timedelta(days=start + i)).date()), float(start + i))
+            for i, order in enumerate(orders)
+        ]
+        frame = pd.DataFrame(orders, columns=["client_id", "date_order", "sales_net"])
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        frame.to_csv(path, mode=mode, header=mode == "w")
+        return handover.dataset_version(path)
+    return write
@@ -0,0 +1,150 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import handover
+
+
+def brute_force(costs, returns, budget):
+    """
+    Best total return of any subset of clients within the budget.
+    """
+    best = 0.0
+    for size in range(len(costs) + 1):
+        for subset in itertools.combinations(range(len(costs)), size):
+            subset = list(subset)
+            if costs[subset].sum() <= budget + 1e-9:
+                best = max(best, returns[subset].sum())
+    return best
+
+
+def random_case(rng, size):
+    costs = rng.integers(1, 5_000, size)/100
+    returns = rng.integers(0, 10_000, size)/100
+    budget = float(rng.uniform(0, costs.sum()))
+    return costs, returns, budget
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_optimize_selection_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    costs, returns, budget = random_case(rng, int(rng.integers(1, 11)))
+    solution = handover.optimize_selection(costs, returns, budget, time_limit=10)
+
+    assert solution["method"] == "exact"
+    assert solution["gap"] == 0.0
+    assert solution["cost"] <= budget + 1e-9
+    assert solution["return"] == pytest.approx(brute_force(costs, returns, budget))
+    assert solution["return"] == pytest.approx(returns[solution["positions"]].sum())
+
+
+def test_optimize_selection_takes_free_clients():
+    costs = np.array([0.0, 10.0, 5.0])
+    returns = np.array([3.0, 4.0, 1.0])
+    solution = handover.optimize_selection(costs, returns, 0.0)
+
+    assert list(solution["positions"]) == [0]
+    assert solution["return"] == 3.0
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_scaled_solver_stays_within_its_gap(seed, monkeypatch):
+    # Too large a table for the exact solver forces the scaled one
+    monkeypatch.setattr(handover, "KNAPSACK_EXACT_CELLS", 0)
+    monkeypatch.setattr(handover, "KNAPSACK_SCALE_STEPS", 50)
+    rng = np.random.default_rng(seed)
+    costs, returns, budget = random_case(rng, 10)
+    optimum = brute_force(costs, returns, budget)
+    solution = handover.optimize_selection(costs, returns, budget, time_limit=10)
+
+    assert solution["method"] in ("scaled", "exact")
+    assert solution["cost"] <= budget + 1e-9
+    assert optimum <= solution["bound"] + 1e-6
+    assert solution["return"] <= optimum + 1e-6
+    assert solution["return"] >= solution["bound"]*(1 - solution["gap"]) - 1e-6
+
+
+def test_exact_solver_is_used_while_the_table_fits(monkeypatch):
+    rng = np.random.default_rng(0)
+    costs, returns, _ = random_case(rng, 40)
+    budget = float(costs.sum()/2)
+
+    assert handover.optimize_selection(costs, returns, budget, time_limit=10)["method"] == "exact"
+    monkeypatch.setattr(handover, "KNAPSACK_EXACT_CELLS", 10)
+    assert handover.optimize_selection(costs, returns, budget, time_limit=10)["method"] == "scaled"
+
+
+def test_time_limit_falls_back_to_greedy():
+    rng = np.random.default_rng(0)
+    costs, returns, _ = random_case(rng, 200)
+    budget = float(costs.sum()/2)
+    solution = handover.optimize_selection(costs, returns, budget, time_limit=0)
+
+    assert solution["method"].startswith("greedy")
+    assert solution["cost"] <= budget + 1e-9
+    assert 0 < solution["return"] <= solution["bound"]
+
+
+def test_read_budget_curve_matches_sequential_selection():
+    rng = np.random.default_rng(0)
+    costs = rng.integers(-20, 200, 300).astype(float)
+    returns = rng.random(300)*100
+    curve = handover.build_budget_curve(costs, returns)
+
+    for budget in rng.uniform(-50, costs.sum(), 100):
+        count = 0
+        spent = 0.0
+        for cost in costs:
+            if spent + cost > budget:
+                break
+            spent += cost
+            count += 1
+        assert handover.read_budget_curve(curve, budget) == (count, pytest.approx(spent), pytest.approx(returns[:count].sum()))
+
+
+def test_sweep_keeps_every_breakpoint():
+    rng = np.random.default_rng(0)
+    costs = rng.integers(1, 100, 200).astype(float)
+    curve = handover.build_budget_curve(costs, rng.random(200))
+    sweep = handover.sweep_budget_curve(curve, 1_000)
+
+    assert list(sweep["Clients"]) == list(range(201))
+    assert list(sweep["Budget"][1:]) == list(np.cumsum(costs))
+
+
+def test_sweep_is_reduced_to_its_points():
+    rng = np.random.default_rng(0)
+    costs = rng.integers(1, 100, 5_000).astype(float)
+    curve = handover.build_budget_curve(costs, rng.random(5_000))
+    sweep = handover.sweep_budget_curve(curve, 500)
+
+    assert len(sweep) == 500
+    assert sweep["Budget"].iloc[0] == 0.0
+    assert sweep["Budget"].iloc[-1] == costs.sum()
+    assert sweep["Budget"].is_monotonic_increasing
+
+
+def test_budget_curve_keeps_its_sweep():
+    rng = np.random.default_rng(0)
+    financial_data = pd.DataFrame({
+        "Priority Score": rng.random(300),
+        "Cost": rng.integers(1, 100, 300).astype(float),
+        "Total Client Return": rng.random(300)*100,
+    })
+    key = ("test_budget_curve_keeps_its_sweep", 0)
+    curve = handover.get_budget_curve(key, "Priority Score", financial_data)
+
+    assert handover.get_budget_curve(key, "Priority Score", financial_data)["sweep"] is curve["sweep"]
+    pd.testing.assert_frame_equal(curve["sweep"], handover.sweep_budget_curve(curve, handover.SWEEP_POINTS))
+
+
+def test_sub_cent_costs_stay_within_budget():
+    costs = np.array([1000.004, 1000.004])
+    solution = handover.optimize_selection(costs, np.array([5.0, 5.0]), 2000.005)
+
+    assert solution["method"] != "exact"
+    assert solution["cost"] <= 2000.005
+    assert list(solution["positions"]) in ([0], [1])
+    assert solution["return"] <= solution["bound"]
@@ -0,0 +1,45 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import handover
+
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({
+        "Client ID": np.arange(10),
+        "Branch ID": pd.Categorical(np.arange(10) % 3),
+        "Total Net Sales": np.linspace(0.0, 90.0, 10),
+        "Contact": ["Phone", "Visit"]*5,
+    })
+
+
+@pytest.mark.parametrize("label", list(handover.EXPORT_FORMATS))
+def test_export_is_accepted_by_download_button(table, label):
+    extension, _ = handover.EXPORT_FORMATS[label]
+    data = handover.export_rows(table, np.array([7, 2, 5]), extension)
+    data, _ = convert_data_to_bytes_and_infer_mime(data, RuntimeError("unsupported type"))
+
+    if extension == "csv":
+        exported = pd.read_csv(io.BytesIO(data))
+    elif extension == "parquet":
+        exported = pd.read_parquet(io.BytesIO(data))
+    else:
+        exported = pd.read_excel(io.BytesIO(data))
+    assert list(exported["Client ID"]) == [7, 2, 5]
+    assert list(exported.columns) == list(table.columns)
+
+
+def test_export_spills_to_new_excel_sheets(table, monkeypatch):
+    monkeypatch.setattr(handover, "EXCEL_MAX_ROWS", 4)
+    monkeypatch.setattr(handover, "EXPORT_CHUNK_ROWS", 3)
+    data = handover.export_rows(table, np.arange(10), "xlsx")
+    sheets = pd.read_excel(io.BytesIO(data), sheet_name=None)
+
+    assert list(sheets) == ["Sheet1", "Sheet2", "Sheet3"]
+    assert [len(sheet) for sheet in sheets.values()] == [4, 4, 2]
+    assert list(pd.concat(sheets.values())["Client ID"]) == list(range(10))
@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+import handover
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(handover, "DATA_STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(handover, "DATA_FILES", [handover.ORDER_HISTORY_FILE])
+    warmed = []
+    monkeypatch.setattr(handover, "warm_tab", lambda tab, versions: warmed.append((tab, versions)))
+    return warmed
+
+
+def new_store():
+    return {"snapshot": None, "failed": None, "error": None, "ready": threading.Event()}
+
+
+def test_valid_data_is_published_then_warmed(data_dir, write_orders):
+    store = new_store()
+    version = write_orders(handover.ORDER_HISTORY_FILE, [1, 2])
+    handover.refresh_snapshot(store)
+
+    assert store["snapshot"]["versions"] == {handover.ORDER_HISTORY_FILE: version}
+    assert store["ready"].is_set()
+    assert os.path.exists(handover.store_path(handover.ORDER_HISTORY_FILE, version))
+    assert [tab for tab, _ in data_dir] == list(handover.TAB_DATASETS)
+
+
+def test_later_data_is_warmed_before_it_is_published(data_dir, write_orders, monkeypatch):
+    store = new_store()
+    write_orders(handover.ORDER_HISTORY_FILE, [1, 2])
+    handover.refresh_snapshot(store)
+    snapshot = store["snapshot"]
+
+    version = write_orders(handover.ORDER_HISTORY_FILE, [1, 2, 3])
+    published = []
+    monkeypatch.setattr(handover, "warm_tab", lambda tab, versions: published.append(store["snapshot"]))
+    handover.refresh_snapshot(store)
+
+    assert store["snapshot"]["versions"] == {handover.ORDER_HISTORY_FILE: version}
+    assert published == [snapshot]*len(handover.TAB_DATASETS)
+
+
+def test_invalid_data_is_neither_published_nor_stored(data_dir, write_orders):
+    store = new_store()
+    published = write_orders(handover.ORDER_HISTORY_FILE, [1, 2])
+    handover.refresh_snapshot(store)
+    snapshot = store["snapshot"]
+    data_dir.clear()
+
+    rejected = write_orders(handover.ORDER_HISTORY_FILE, [1, None])
+    handover.refresh_snapshot(store)
+
+    assert store["snapshot"] is snapshot
+    assert store["failed"] == {handover.ORDER_HISTORY_FILE: rejected}
+    assert "client_id" in store["error"]
+    assert data_dir == []
+    assert not os.path.exists(handover.store_path(handover.ORDER_HISTORY_FILE, rejected))
+    assert all(key[2] != rejected for key in handover.get_data_cache()["entries"])
+    assert len(handover.load_data(handover.ORDER_HISTORY_FILE, version=published)) == 2
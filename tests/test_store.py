@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import handover
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(handover, "DATA_STORE_DIR", str(tmp_path / "store"))
+    snapshots = handover.get_snapshot_store()
+    published = snapshots["snapshot"]
+    yield snapshots
+    snapshots["snapshot"] = published
+
+
+def test_parse_refuses_a_changed_file(tmp_path, write_orders):
+    path = str(tmp_path / "top_client_data.csv")
+    version = write_orders(path, [1, 2, 3])
+    assert len(handover.parse_csv(path, version=version)) == 3
+
+    write_orders(path, [1, 2, 3, 4])
+    with pytest.raises(ValueError):
+        handover.parse_csv(path, version=version)
+
+
+def test_published_version_is_never_pruned(tmp_path, store, write_orders):
+    path = str(tmp_path / "top_client_data.csv")
+    published = write_orders(path, [1]*10)
+    handover.read_data(path, version=published)
+    store["snapshot"] = {"versions": {path: published}}
+
+    for size in (20, 30):
+        handover.read_data(path, version=write_orders(path, [2]*size))
+
+    assert os.path.exists(handover.store_path(path, published))
+    assert len(handover.read_data(path, version=published)) == 10
+
+
+def test_missing_version_is_not_read_from_a_newer_file(tmp_path, store, write_orders):
+    path = str(tmp_path / "top_client_data.csv")
+    version = write_orders(path, [1]*10)
+    write_orders(path, [2]*30)
+
+    with pytest.raises(ValueError):
+        handover.read_data(path, version=version)
+    assert not os.path.exists(handover.store_path(path, version))
+
+
+def test_order_history_is_stored_by_client(tmp_path, store, write_orders):
+    path = str(tmp_path / "top_client_data.csv")
+    version = write_orders(path, [3, 1, 2, 1, 3, 1])
+    orders = handover.read_data(path, version=version)
+
+    assert list(orders["client_id"]) == [1, 1, 1, 2, 3, 3]
+    assert list(orders["sales_net"]) == [1.0, 3.0, 5.0, 2.0, 0.0, 4.0]
+    order_index = handover.build_order_index(("test", version), orders)
+    assert order_index["orders"] is orders
+    assert list(handover.lookup_orders(order_index, 3)["sales_net"]) == [0.0, 4.0]
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import handover
+
+
+@pytest.fixture
+def branch_of():
+    return pd.Series([1, 1, 2], index=[10, 11, 12])
+
+
+def monthly_state(path, branch_of):
+    return handover.get_summary_store()["monthly"][(path, id(branch_of))]
+
+
+def random_orders(rng, size):
+    return list(zip(
+        rng.choice([10, 11, 12, 13], size).tolist(),
+        (np.datetime64("2020-01-01") + rng.integers(0, 400, size)).astype(str).tolist(),
+        np.round(rng.uniform(-50, 500, size), 2).tolist(),
+    ))
+
+
+def recompute(path, branch_of):
+    """
+    Total the whole order history from scratch.
+    """
+    orders = pd.read_csv(path, parse_dates=["date_order"])
+    return handover.monthly_revenue_frame(handover.aggregate_monthly_revenue(orders, branch_of))
+
+
+def assert_same_totals(actual, expected):
+    key = ["branch_id", "month"]
+    actual = actual.sort_values(key, na_position="first", ignore_index=True)
+    expected = expected.sort_values(key, na_position="first", ignore_index=True)
+    pd.testing.assert_frame_equal(actual[key], expected[key], check_dtype=False)
+    np.testing.assert_allclose(actual["sales_net"], expected["sales_net"])
+
+
+def test_appended_orders_are_added_to_the_totals(tmp_path, branch_of, write_orders):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, random_orders(rng, 200))
+    summary = {"branch_of": branch_of}
+    assert_same_totals(handover.get_monthly_revenue(path, summary), recompute(path, branch_of))
+
+    write_orders(path, random_orders(rng, 50), mode="a", start=200)
+    offset = monthly_state(path, branch_of)["offset"]
+    revenue = handover.get_monthly_revenue(path, summary, refresh=True)
+
+    assert monthly_state(path, branch_of)["offset"] > offset
+    assert_same_totals(revenue, recompute(path, branch_of))
+
+
+def test_totals_are_kept_until_refreshed(tmp_path, branch_of, write_orders):
+    rng = np.random.default_rng(1)
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, random_orders(rng, 20))
+    summary = {"branch_of": branch_of}
+    before = handover.get_monthly_revenue(path, summary)
+
+    write_orders(path, random_orders(rng, 20), mode="a", start=20)
+    assert_same_totals(handover.get_monthly_revenue(path, summary), before)
+    assert_same_totals(handover.get_monthly_revenue(path, summary, refresh=True), recompute(path, branch_of))
+
+
+def test_partial_last_line_waits_for_the_next_update(tmp_path, branch_of, write_orders):
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, [(10, "2020-01-05", 100.0), (12, "2020-02-01", 50.0)])
+    summary = {"branch_of": branch_of}
+    handover.get_monthly_revenue(path, summary)
+
+    with open(path, "a") as f:
+        f.write("2,11,2020-01-20,25.0\n3,12,2020-0")
+    revenue = handover.get_monthly_revenue(path, summary, refresh=True)
+    complete = pd.read_csv(path, nrows=3, parse_dates=["date_order"])
+    assert_same_totals(
+        revenue,
+        handover.monthly_revenue_frame(handover.aggregate_monthly_revenue(complete, branch_of))
+    )
+
+    with open(path, "a") as f:
+        f.write("2-10,7.5\n")
+    assert_same_totals(handover.get_monthly_revenue(path, summary, refresh=True), recompute(path, branch_of))
+
+
+def test_partial_last_line_is_left_out_of_the_first_build(tmp_path, branch_of, write_orders):
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, [(10, "2020-01-05", 100.0), (12, "2020-02-01", 50.0)])
+    complete = recompute(path, branch_of)
+    with open(path, "a") as f:
+        f.write("2,11,2020-0")
+    summary = {"branch_of": branch_of}
+
+    assert_same_totals(handover.get_monthly_revenue(path, summary), complete)
+    with open(path, "a") as f:
+        f.write("3-10,7.5\n")
+    assert_same_totals(handover.get_monthly_revenue(path, summary, refresh=True), recompute(path, branch_of))
+
+
+def test_rows_appended_during_a_read_are_counted_once(tmp_path, branch_of, monkeypatch, write_orders):
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, [(10, "2020-01-05", 100.0), (12, "2020-02-01", 50.0)])
+    aggregate = handover.aggregate_monthly_revenue
+
+    def append_then_aggregate(orders, branch_of):
+        monkeypatch.setattr(handover, "aggregate_monthly_revenue", aggregate)
+        write_orders(path, [(11, "2020-01-20", 25.0)], mode="a", start=2)
+        return aggregate(orders, branch_of)
+
+    monkeypatch.setattr(handover, "aggregate_monthly_revenue", append_then_aggregate)
+    summary = {"branch_of": branch_of}
+    handover.get_monthly_revenue(path, summary)
+    assert_same_totals(handover.get_monthly_revenue(path, summary, refresh=True), recompute(path, branch_of))
+
+
+def test_rewritten_history_is_rebuilt(tmp_path, branch_of, write_orders):
+    rng = np.random.default_rng(2)
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, random_orders(rng, 100))
+    summary = {"branch_of": branch_of}
+    handover.get_monthly_revenue(path, summary)
+
+    write_orders(path, random_orders(rng, 120))
+    assert_same_totals(handover.get_monthly_revenue(path, summary, refresh=True), recompute(path, branch_of))
+
+
+def test_new_client_table_rebuilds_the_totals(tmp_path, branch_of, write_orders):
+    rng = np.random.default_rng(3)
+    path = str(tmp_path / "orders.csv")
+    write_orders(path, random_orders(rng, 100))
+    handover.get_monthly_revenue(path, {"branch_of": branch_of})
+
+    moved = pd.Series([2, 2, 1, 1], index=[10, 11, 12, 13])
+    assert_same_totals(handover.get_monthly_revenue(path, {"branch_of": moved}), recompute(path, moved))
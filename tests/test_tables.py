@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import handover
+
+
+@pytest.fixture(scope="module")
+def clients():
+    rng = np.random.default_rng(0)
+    size = 500
+    return pd.DataFrame({
+        "client_id": rng.permutation(size) + 1_000,
+        "branch_id": pd.Categorical(rng.integers(1, 6, size)),
+        # Coarse values so the sorts have ties
+        "priority_score": (rng.integers(0, 20, size)/2).astype("float32"),
+        "churn_probability": rng.random(size).astype("float32"),
+        "tot_sales_net": rng.integers(0, 50, size)*100.0,
+        "avg_freq_orders": rng.random(size).astype("float32"),
+        "lag_day_last": rng.integers(0, 700, size).astype("float32"),
+        "pref_cont_method": pd.Categorical(rng.choice(["Phone", "Visit", "Online"], size)),
+        "client_type": pd.Categorical(rng.choice(["recurrent_client", "occasional_client", "new_client"], size)),
+        "nb_orders": rng.integers(1, 200, size),
+    })
+
+
+@pytest.fixture(scope="module")
+def ranking_index(clients):
+    return handover.build_ranking_index(("test_tables", 0), clients)
+
+
+@pytest.mark.parametrize("branch", ["All", 3])
+@pytest.mark.parametrize("client_types", [
+    ["recurrent_client", "occasional_client", "new_client"],
+    ["occasional_client", "new_client"],
+    ["new_client"],
+    [],
+])
+@pytest.mark.parametrize("sort_by", [""] + handover.RANKING_SORTS)
+def test_cursor_pages_match_a_filtered_sort(clients, ranking_index, branch, client_types, sort_by):
+    table = ranking_index["table"]
+    selected = clients["client_type"].isin(client_types).to_numpy()
+    if branch != "All":
+        selected = selected & (clients["branch_id"] == branch).to_numpy()
+    expected = table[selected]
+    if sort_by:
+        expected = expected.sort_values(sort_by, ascending=False, kind="stable")
+
+    cursor = handover.open_ranking_cursor(ranking_index, branch, client_types, sort_by)
+    assert cursor["total"] == len(expected)
+    pages = [handover.read_cursor(cursor, start, start + 7) for start in range(0, len(expected) + 7, 7)]
+    assert list(table.index[np.concatenate(pages)]) == list(expected.index)
+
+
+def test_cursor_reads_pages_out_of_order(clients, ranking_index):
+    cursor = handover.open_ranking_cursor(ranking_index, 2, ["new_client", "recurrent_client"], "Total Net Sales")
+    last = handover.read_cursor(cursor, 40, 60)
+    first = handover.read_cursor(cursor, 0, 20)
+
+    reference = handover.open_ranking_cursor(ranking_index, 2, ["new_client", "recurrent_client"], "Total Net Sales")
+    assert list(first) == list(handover.read_cursor(reference, 0, 20))
+    assert list(last) == list(handover.read_cursor(reference, 40, 60))
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(10_000)
+    y = np.sin(x/500)
+    y[4_321] = 50.0
+    kept = handover.downsample_lttb(x, y, 200)
+
+    assert len(kept) == 200
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert (np.diff(kept) > 0).all()
+    assert 4_321 in kept
+
+
+def test_lttb_keeps_short_series_whole():
+    assert list(handover.downsample_lttb(np.arange(50), np.zeros(50), 100)) == list(range(50))
+
+
+def test_batched_order_lookup_matches_per_client_slices():
+    rng = np.random.default_rng(1)
+    orders = pd.DataFrame({
+        "client_id": rng.integers(0, 40, 2_000),
+        "date_order": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 700, 2_000), unit="D"),
+        "sales_net": rng.random(2_000),
+    })
+    order_index = handover.build_order_index(("test_tables", 1), orders)
+    client_ids = [17, 3, 999, 38, 0, 3]
+
+    batched = handover.lookup_orders_batch(order_index, client_ids)
+    one_by_one = pd.concat([handover.lookup_orders(order_index, client_id) for client_id in client_ids])
+    pd.testing.assert_frame_equal(batched, one_by_one)
+    assert handover.lookup_orders_batch(order_index, [999]).empty
+
+
+def test_scores_are_weighted_feature_ranks(clients):
+    engine = handover.build_scoring_engine(("test_tables", 2), clients)
+    weights = (0.5, 0.0, 0.25, 0.25, 0.0)
+    scores = handover.score_clients(engine, weights)
+
+    expected = sum(
+        weight*clients[column].rank(pct=True)
+        for weight, column in zip(weights, handover.SCORING_FEATURES)
+    )*100/sum(weights)
+    np.testing.assert_allclose(scores, expected, rtol=1e-5)
+    assert handover.score_clients(engine, weights) is scores
+
+
+def test_score_memo_is_bounded(clients, monkeypatch):
+    monkeypatch.setattr(handover, "SCORE_MEMO_SIZE", 3)
+    engine = handover.build_scoring_engine(("test_tables", 3), clients)
+    for i in range(1, 6):
+        handover.score_clients(engine, (float(i), 1.0, 0.0, 0.0, 0.0))
+
+    assert list(engine["scores"]) == [(float(i), 1.0, 0.0, 0.0, 0.0) for i in (3, 4, 5)]
+
+
+def test_rescored_ranking_follows_the_scores(clients, ranking_index):
+    engine = handover.build_scoring_engine(("test_tables", 4), clients)
+    weights = (1.0, 0.0, 0.0, 0.0, 0.0)
+    scores = handover.score_clients(engine, weights)
+    # Score the clients in reverse order to check the alignment
+    scored_clients = engine["clients"][::-1]
+    key = ("test_tables", 4, weights)
+    rescored = handover.rescore_ranking_index(key, ranking_index, scores, scored_clients, clients["client_id"])
+
+    expected = np.round(scores[::-1].astype("float64"), 2)
+    np.testing.assert_array_equal(rescored["table"]["Priority Score"], expected)
+    assert list(rescored["orders"]["Priority Score"]) == list(np.argsort(-expected, kind="stable"))
+    assert handover.rescore_ranking_index(key, ranking_index, scores, scored_clients, clients["client_id"]) is rescored